@@ -2,20 +2,47 @@
 FastAPI Application
 Main entry point — registers routes, middleware, and exception handlers.
 """
+import atexit
+import logging
 import os
+import queue
 from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 
 from app.utils.error_handler import AppError, app_error_handler, generic_error_handler
-from app.utils import cache_service
+from app.utils.json_response import ORJSONResponse
+from app.utils import cache_service, document_parser
+from app.services.embeddings import embedding_service
+from app.services.llm import llm_service
 from app.vectorstore import vector_store_service
 
 from app.routes.documents import router as documents_router
 from app.routes.query import router as query_router
 from app.routes.compare import router as compare_router
 
+# ─── Logging ──────────────────────────────────────────────
+# Callers only enqueue records; a listener thread formats and writes them,
+# so request threads never block on stderr. The listener starts together
+# with the handler and runs for the life of the process (scripts and tests
+# that never run the lifespan included); atexit drains what is left.
+# LOG_LEVEL applies to the app's loggers; third-party libraries stay at the
+# root default (WARNING).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+_APP_LOGGERS = ("vectorstore",)
+
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_log_output = logging.StreamHandler()
+_log_output.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+_log_listener = QueueListener(_log_queue, _log_output)
+logging.getLogger().addHandler(QueueHandler(_log_queue))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+for _name in _APP_LOGGERS:
+    logging.getLogger(_name).setLevel(LOG_LEVEL)
+
 
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
@@ -23,10 +50,19 @@ async def lifespan(_app: FastAPI):
     # ── Startup ──
     print("[Server] Initializing vector store...")
     vector_store_service.initialize()
+    llm_service.open_client()
+    print("[Server] Warming up embedding model...")
+    try:
+        # Load + first inference here instead of on the first request
+        await embedding_service.generate_embeddings(["warmup"])
+    except AppError as e:
+        print(f"[Server] Embedding warm-up failed, will retry on first use: {e.message}")
     print("[Server] RAG system ready!")
     yield
     # ── Shutdown ──
     print("[Server] Shutting down — clearing caches...")
+    await llm_service.close_client()
+    document_parser.shutdown_pdf_pool()
     cache_service.flush_all()
     print("[Server] Goodbye.")
 
@@ -36,6 +72,7 @@ app = FastAPI(
     description="Production-grade RAG system using Groq LLM and ChromaDB",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # ─── CORS ─────────────────────────────────────────────────
@@ -60,16 +97,18 @@ app.include_router(compare_router)
 @app.get("/health")
 async def health():
     """Health check endpoint."""
+    # Returned as a response object so probes skip jsonable_encoder entirely
     stats = vector_store_service.get_stats()
-    return {
+    return ORJSONResponse({
         "status": "healthy",
         "service": "AI RAG System",
         "vector_store": {
             "total_chunks": stats["total_chunks"],
             "total_documents": stats["total_documents"],
+            "search_cache": vector_store_service.get_cache_stats(),
         },
         "cache": cache_service.get_stats(),
-    }
+    })
 
 
 # ─── Client UI ────────────────────────────────────────────
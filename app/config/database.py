@@ -6,5 +6,24 @@ import os
 
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_data")
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "rag_documents")
+# Keep on a local disk/SSD: SQLite locking and fsync are unreliable and slow on NFS
+SQLITE_WAL = os.getenv("CHROMA_SQLITE_WAL", "true").lower() == "true"  # WAL journal for chroma.sqlite3
 DISTANCE_FUNCTION = "cosine"  # cosine | l2 | ip
 BATCH_SIZE = 100  # max chunks to insert per batch
+DELETE_BATCH_SIZE = int(os.getenv("CHROMA_DELETE_BATCH_SIZE", "5000"))  # chunk IDs per delete call
+
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))  # all-MiniLM-L6-v2 vector size
+
+# HNSW graph tuning. M / ef_construction are fixed when the collection is
+# created; ef_search (query beam width) is re-applied to existing collections.
+HNSW_M = int(os.getenv("HNSW_M", "24"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "128"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+HNSW_BATCH_SIZE = 1000       # vectors buffered before indexing
+HNSW_SYNC_THRESHOLD = 10000  # vectors indexed between flushes to disk
+
+# Search-result cache in front of collection queries (see vectorstore/query_cache.py)
+SEARCH_CACHE_MAX = int(os.getenv("SEARCH_CACHE_MAX", "2000"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))  # seconds
+# Cosine similarity at which a cached query answers a new one (> 1 disables)
+SEARCH_CACHE_SIMILARITY = float(os.getenv("SEARCH_CACHE_SIMILARITY", "0.97"))
@@ -0,0 +1,25 @@
+"""
+Ingestion Pipeline Configuration
+Chunks flow through bounded queues: producer → embed workers → writer.
+"""
+import os
+from dataclasses import dataclass
+
+from app.config.llm import EMBEDDING_WORKERS
+
+# Chunks per embed/write micro-batch
+BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "20"))
+# Embed workers pulling micro-batches concurrently. One more than the
+# inference threads keeps a batch tokenizing/queued while the others run, so
+# the pool never idles; more than that only adds queueing.
+MAX_CONCURRENT_BATCHES = int(os.getenv("INDEX_MAX_CONCURRENT_BATCHES", str(EMBEDDING_WORKERS + 1)))
+# Micro-batches buffered between stages (back-pressure on faster stages)
+MAX_QUEUE_SIZE = int(os.getenv("INDEX_MAX_QUEUE_SIZE", "8"))
+
+
+@dataclass(frozen=True)
+class IndexingConfig:
+    """Per-call tuning for rag_service.ingest_document."""
+    batch_size: int = BATCH_SIZE
+    max_concurrent_batches: int = MAX_CONCURRENT_BATCHES
+    max_queue_size: int = MAX_QUEUE_SIZE
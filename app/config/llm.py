@@ -10,6 +10,14 @@ MODEL = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
 
 # Local embedding model (ONNX runtime — runs locally, free)
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Dynamically quantize the embedding model to INT8 (built once, cached on disk)
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "true").lower() in ("1", "true", "yes")
+# "cpu" (default) or "cuda" — cuda needs onnxruntime-gpu (+ onnxconverter-common for FP16)
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu").lower()
+# Embedding micro-batches allowed in flight at once during batched generation
+EMBEDDING_PARALLEL_BATCHES = int(os.getenv("EMBEDDING_PARALLEL_BATCHES", "8"))
+# Threads dedicated to embedding inference (default: half the CPU cores)
+EMBEDDING_WORKERS = max(1, int(os.getenv("EMBEDDING_WORKERS", str((os.cpu_count() or 2) // 2))))
 
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.1"))
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "2048"))
@@ -9,6 +9,7 @@ from fastapi import APIRouter, File, Form, UploadFile, HTTPException
 from typing import Optional
 
 from app.services.rag import rag_service
+from app.utils.validators import is_uuid
 
 router = APIRouter(prefix="/api/documents", tags=["Documents"])
 
@@ -41,17 +42,22 @@ async def upload_document(
     if chunk_overlap is not None and not (0 <= chunk_overlap <= 500):
         raise HTTPException(400, "chunk_overlap must be between 0 and 500")
 
-    # Read file content
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
+    # Check size from the upload's spooled temp file (Starlette keeps small
+    # uploads in memory and rolls larger ones to disk) instead of reading the
+    # whole payload into a bytes object first.
+    size = file.size
+    if size is None:
+        size = file.file.seek(0, 2)
+    if size > MAX_FILE_SIZE:
         raise HTTPException(413, "File size exceeds 50 MB limit")
-    if len(content) == 0:
+    if size == 0:
         raise HTTPException(400, "Uploaded file is empty")
+    file.file.seek(0)
 
     try:
         result = await rag_service.ingest_document(
             filename=file.filename,
-            content=content,
+            content=file.file,
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
         )
@@ -82,10 +88,7 @@ async def get_stats():
 @router.delete("/{document_id}")
 async def delete_document(document_id: str):
     """Delete a document and all its chunks."""
-    import uuid as _uuid
-    try:
-        _uuid.UUID(document_id)
-    except ValueError:
+    if not is_uuid(document_id):
         raise HTTPException(400, "Invalid document ID (must be UUID)")
 
     try:
@@ -1,8 +1,11 @@
 """
 Query Routes
-POST /api/query — Ask a question against the document corpus
+POST /api/query        — Ask a question against the document corpus
+POST /api/query/stream — Same, streaming the answer as Server-Sent Events
 """
+import orjson
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 
 from app.utils.validators import QueryRequest
 from app.services.rag import rag_service
@@ -31,3 +34,35 @@ async def query(req: QueryRequest):
         raise HTTPException(400, str(e))
     except Exception as e:
         raise HTTPException(500, f"Query failed: {e}")
+
+
+
+@router.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """
+    Stream the answer as Server-Sent Events: `token` events carry answer
+    deltas as they are generated, a final `done` event carries the same
+    payload as POST /api/query, and `error` is sent if the pipeline fails.
+    """
+    async def events():
+        try:
+            async for event in rag_service.query_documents_stream(
+                query=req.query,
+                top_k=req.top_k,
+                document_id=req.document_id,
+                temperature=req.temperature,
+                include_metadata=req.include_metadata,
+                verify=req.verify,
+                rerank=req.rerank,
+            ):
+                kind = event.pop("type")
+                yield f"event: {kind}\ndata: {orjson.dumps(event).decode()}\n\n"
+        except Exception as e:
+            payload = orjson.dumps({"message": f"Query failed: {e}"}).decode()
+            yield f"event: error\ndata: {payload}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
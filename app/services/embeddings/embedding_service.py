@@ -1,35 +1,176 @@
 """
 Embedding Service
-Generates vector embeddings using ChromaDB's built-in ONNX embedding model.
+Generates vector embeddings with the all-MiniLM-L6-v2 ONNX model shipped by ChromaDB.
 Same model as sentence-transformers all-MiniLM-L6-v2 (384-dim) but runs via
 onnxruntime instead of PyTorch — uses ~100 MB RAM instead of ~2 GB.
+By default the FP32 weights are dynamically quantized to INT8 once and cached
+next to the original model, which roughly halves weight bandwidth and lets
+onnxruntime use int8 GEMM kernels (VNNI) on modern CPUs. With
+EMBEDDING_DEVICE=cuda an FP16 copy runs on the CUDA execution provider instead.
 No API key needed, no cost, no rate limits.
 """
 import asyncio
+import concurrent.futures
 import gc
-from typing import List, Optional
+import os
+from typing import List, Optional, Tuple
 
+import numpy as np
+
+from app.config import llm as llm_config
 from app.utils import cache_service
 from app.utils.error_handler import ExternalServiceError
 
 # ─── Model (lazy-loaded on first use) ─────────────────────
 
+MAX_SEQ_LENGTH = 256  # same truncation ChromaDB applies
+
 _embed_fn = None
+_WARMED = False  # first successful load done; the model then stays resident
+_LOAD_LOCK = asyncio.Lock()  # one cold-start load even under concurrent callers
+
+# Dedicated pool so CPU-bound inference never starves the default executor
+# (file IO, ChromaDB calls). onnxruntime releases the GIL inside Run(), so
+# these threads execute in parallel; intra-op threads are split between
+# them to avoid oversubscribing the cores.
+_EMBED_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=llm_config.EMBEDDING_WORKERS,
+    thread_name_prefix="embed",
+)
+_INTRA_OP_THREADS = max(1, (os.cpu_count() or 1) // llm_config.EMBEDDING_WORKERS)
+
+
+class _OnnxEmbedder:
+    """Tokenize → ONNX forward pass → mean-pool → L2-normalize."""
+
+    def __init__(self, model_path: str, tokenizer_path: str, providers: Optional[List] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        # Pad to the longest text in each batch rather than a fixed 256 tokens
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.intra_op_num_threads = _INTRA_OP_THREADS
+        self.session = ort.InferenceSession(
+            model_path, sess_options=so, providers=providers or ["CPUExecutionProvider"],
+        )
+        self.model_path = model_path
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        last_hidden_state = self.session.run(None, {
+            "input_ids": input_ids,
+            "attention_mask": attention_mask,
+            "token_type_ids": np.zeros_like(input_ids),
+        })[0]
+
+        # Mean pooling over real (non-padding) tokens
+        mask = attention_mask[:, :, None].astype(np.float32)
+        summed = (last_hidden_state * mask).sum(axis=1)
+        pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+def _model_dir() -> str:
+    """Ensure ChromaDB's ONNX MiniLM files are downloaded and return their folder."""
+    from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+
+    ONNXMiniLM_L6_V2()._download_model_if_not_exists()
+    return os.path.join(ONNXMiniLM_L6_V2.DOWNLOAD_PATH, ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)
+
+
+def _quantized_model(model_dir: str) -> str:
+    """Return the INT8 model path, building it from the FP32 model on first use."""
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    quant_path = os.path.join(model_dir, "model_quant.onnx")
+    if not os.path.exists(quant_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("[Embeddings] Quantizing ONNX model to INT8 (one-time)...")
+        tmp_path = f"{quant_path}.{os.getpid()}.tmp"
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8, per_channel=False)
+        os.replace(tmp_path, quant_path)
+    return quant_path
+
+
+def _fp16_model(model_dir: str) -> str:
+    """Return an FP16 copy of the model for GPU inference, building it on first use."""
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    fp16_path = os.path.join(model_dir, "model_fp16.onnx")
+    if not os.path.exists(fp16_path):
+        import onnx
+        from onnxconverter_common import float16
+
+        print("[Embeddings] Converting ONNX model to FP16 (one-time)...")
+        model = float16.convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True)
+        tmp_path = f"{fp16_path}.{os.getpid()}.tmp"
+        onnx.save(model, tmp_path)
+        os.replace(tmp_path, fp16_path)
+    return fp16_path
 
 
-def _get_embed_fn():
-    """Lazy-load ChromaDB's built-in ONNX embedding function."""
-    global _embed_fn
+def _cuda_available() -> bool:
+    import onnxruntime as ort
+    return "CUDAExecutionProvider" in ort.get_available_providers()
+
+
+def _select_model(model_dir: str) -> Tuple[str, List]:
+    """Pick model file + execution providers for the configured EMBEDDING_DEVICE."""
+    model_path = os.path.join(model_dir, "model.onnx")
+
+    if llm_config.EMBEDDING_DEVICE == "cuda":
+        if _cuda_available():
+            try:
+                model_path = _fp16_model(model_dir)
+            except Exception as e:
+                print(f"[Embeddings] FP16 conversion unavailable, using FP32 model on GPU: {e}")
+            providers = [
+                ("CUDAExecutionProvider", {"device_id": 0, "arena_extend_strategy": "kNextPowerOfTwo"}),
+                "CPUExecutionProvider",
+            ]
+            return model_path, providers
+        print("[Embeddings] EMBEDDING_DEVICE=cuda but CUDAExecutionProvider is unavailable — using CPU")
+
+    if llm_config.EMBEDDING_QUANTIZE:
+        try:
+            model_path = _quantized_model(model_dir)
+        except Exception as e:
+            print(f"[Embeddings] INT8 quantization unavailable, using FP32 model: {e}")
+    return model_path, ["CPUExecutionProvider"]
+
+
+def _load_sync():
+    """
+    Load the ONNX embedding model (INT8 on CPU, FP16 on CUDA).
+    Blocking; async callers go through _ensure_loaded().
+    """
+    global _embed_fn, _WARMED
     if _embed_fn is None:
         try:
-            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
-            print("[Embeddings] Loading ONNX embedding model (all-MiniLM-L6-v2)...")
-            _embed_fn = DefaultEmbeddingFunction()
+            print(f"[Embeddings] Loading ONNX embedding model ({llm_config.EMBEDDING_MODEL})...")
+            model_dir = _model_dir()
+            model_path, providers = _select_model(model_dir)
+            embedder = _OnnxEmbedder(model_path, os.path.join(model_dir, "tokenizer.json"), providers)
             # Warm-up call to verify it works
-            test = _embed_fn(["test"])
+            test = embedder(["test"])
             dim = len(test[0])
-            print(f"[Embeddings] Model loaded — dimension: {dim}, backend: onnxruntime")
-            gc.collect()  # Free any temp allocations from model loading
+            print(f"[Embeddings] Model loaded — dimension: {dim}, "
+                  f"backend: onnxruntime ({os.path.basename(model_path)}, "
+                  f"{embedder.session.get_providers()[0]})")
+            if not _WARMED:
+                # Young-generation sweep of the loader's temporaries; no
+                # full-heap pass, and never repeated on a reload.
+                gc.collect(1)
+                _WARMED = True
+            _embed_fn = embedder
         except Exception as e:
             raise ExternalServiceError(
                 "Embeddings",
@@ -38,42 +179,54 @@ def _get_embed_fn():
     return _embed_fn
 
 
+async def _ensure_loaded():
+    """Load the model off the event loop, at most once across concurrent callers."""
+    if _embed_fn is None:
+        async with _LOAD_LOCK:
+            if _embed_fn is None:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(None, _load_sync)
+
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    """Run one inference batch (executes on an _EMBED_POOL thread)."""
+    return np.ascontiguousarray(_embed_fn(texts), dtype=np.float32)
+
+
 # ─── Single Embedding ─────────────────────────────────────
 
-async def generate_embedding(text: str, skip_cache: bool = False) -> List[float]:
+async def generate_embedding(text: str, skip_cache: bool = False) -> np.ndarray:
     """Generate an embedding for a single text string (with caching)."""
     if not skip_cache:
         cached = cache_service.get_embedding(text)
         if cached is not None:
             return cached
 
-    embeddings = await generate_embeddings([text])
-    emb = embeddings[0]
+    emb = (await generate_embeddings([text]))[0]
     cache_service.set_embedding(text, emb)
     return emb
 
 
 # ─── Batch Embeddings ────────────────────────────────────
 
-async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+async def generate_embeddings(texts: List[str]) -> np.ndarray:
     """
     Generate embeddings for a list of texts.
     Runs in a thread pool to avoid blocking the async event loop.
+
+    Returns a contiguous float32 array of shape (len(texts), dim); vectors
+    stay as arrays all the way to the cache and ChromaDB.
     """
     if not texts:
-        return []
+        return np.empty((0, 0), dtype=np.float32)
 
     # Replace empty / whitespace-only texts
     valid_texts = [t if t and t.strip() else "[empty]" for t in texts]
 
     try:
-        embed_fn = _get_embed_fn()
-        loop = asyncio.get_event_loop()
-        embeddings = await loop.run_in_executor(
-            None,
-            lambda: [list(map(float, e)) for e in embed_fn(valid_texts)]
-        )
-        return embeddings
+        await _ensure_loaded()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_EMBED_POOL, _embed_batch, valid_texts)
     except Exception as e:
         raise ExternalServiceError("Embeddings", f"Embedding generation failed: {e}")
 
@@ -84,15 +237,16 @@ async def generate_embeddings_batched(
     texts: List[str],
     batch_size: int = 32,
     skip_cache: bool = False,
-) -> List[List[float]]:
+) -> np.ndarray:
     """
     Generate embeddings in batches with caching.
     Checks cache first, only generates for misses.
+    Returns a float32 array of shape (len(texts), dim) in input order.
     """
     if not texts:
-        return []
+        return np.empty((0, 0), dtype=np.float32)
 
-    results: List[Optional[List[float]]] = [None] * len(texts)
+    results: List[Optional[np.ndarray]] = [None] * len(texts)
     texts_to_generate: List[str] = []
     indices_to_fill: List[int] = []
 
@@ -107,25 +261,34 @@ async def generate_embeddings_batched(
 
         if not texts_to_generate:
             print(f"[Embeddings] All {len(texts)} embeddings served from cache")
-            return results  # type: ignore
+            return np.asarray(results, dtype=np.float32)
         print(f"[Embeddings] Cache: {len(hits)} hits, {len(misses)} misses")
     else:
         texts_to_generate = list(texts)
         indices_to_fill = list(range(len(texts)))
 
-    # Generate in batches
-    generated: List[List[float]] = []
-    for i in range(0, len(texts_to_generate), batch_size):
-        batch = texts_to_generate[i : i + batch_size]
-        embs = await generate_embeddings(batch)
-        generated.extend(embs)
+    # Sort by length so each batch pads to a similar sequence length, run the
+    # batches concurrently, then scatter the rows back into miss order
+    order = sorted(range(len(texts_to_generate)), key=lambda i: len(texts_to_generate[i]))
+    sorted_texts = [texts_to_generate[i] for i in order]
+    batches = [sorted_texts[i : i + batch_size] for i in range(0, len(sorted_texts), batch_size)]
+
+    semaphore = asyncio.Semaphore(llm_config.EMBEDDING_PARALLEL_BATCHES)
+
+    async def _run(batch: List[str]) -> np.ndarray:
+        async with semaphore:
+            return await generate_embeddings(batch)
+
+    generated_sorted = np.concatenate(await asyncio.gather(*(_run(b) for b in batches)))
+    generated_arr = np.empty_like(generated_sorted)
+    generated_arr[order] = generated_sorted
 
     # Fill results and cache new embeddings
     to_cache = {}
-    for j, emb in enumerate(generated):
+    for j, emb in enumerate(generated_arr):
         idx = indices_to_fill[j]
         results[idx] = emb
         to_cache[texts_to_generate[j]] = emb
 
     cache_service.set_embeddings_batch(to_cache)
-    return results  # type: ignore
+    return np.asarray(results, dtype=np.float32)
@@ -8,11 +8,13 @@ Implements a 3-layer hallucination-reduction strategy:
   3. Citation enforcement — model must reference source chunks
 """
 import asyncio
-import json
+import random
 import re
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
+import orjson
 
 from app.config import llm as llm_config
 from app.utils.error_handler import ExternalServiceError
@@ -123,28 +125,142 @@ RULES:
 5. Be strict — if context doesn't explicitly state something, it's not supported"""
 
 
+# Pre-built system messages (never mutated). Each prompt is always the first
+# message and byte-identical across calls, which lets Groq's automatic
+# prompt-prefix caching reuse it between requests.
+_SYS_QUERY = {"role": "system", "content": QUERY_SYSTEM_PROMPT}
+_SYS_COMPARE = {"role": "system", "content": COMPARE_SYSTEM_PROMPT}
+_SYS_COMPARE_STRUCTURED = {"role": "system", "content": COMPARE_STRUCTURED_SYSTEM_PROMPT}
+_SYS_VERIFICATION = {"role": "system", "content": VERIFICATION_SYSTEM_PROMPT}
+
+
+# ─── Response Patterns ────────────────────────────────────
+
+_CONF_RE = re.compile(r"\[CONFIDENCE:\s*(\d+)/10\s*\|\s*REASON:\s*(.+?)\]\s*$", re.IGNORECASE)
+_JSON_FENCE_RE = re.compile(r"```json\n?|\n?```")
+# Confidence level for scores 1..10 (out-of-range scores are clamped)
+_LEVELS = ("very_low", "very_low", "low", "low", "medium",
+           "medium", "high", "high", "very_high", "very_high")
+
+
+def _strip_json_fence(response: str) -> str:
+    """Remove ```json fences the model sometimes wraps around JSON output."""
+    if "```" not in response:
+        return response.strip()
+    return _JSON_FENCE_RE.sub("", response).strip()
+
+
+def _parse_json_response(response: str) -> Any:
+    """
+    Parse the JSON object in a model reply. Slicing from the first "{" to the
+    last "}" skips code fences and stray prose without a regex pass; the
+    fence-stripping regex is only the fallback.
+    """
+    start, end = response.find("{"), response.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return orjson.loads(response[start:end + 1])
+        except ValueError:
+            pass
+    return orjson.loads(_strip_json_fence(response))
+
+
 # ─── HTTP client ──────────────────────────────────────────
 
 _client: Optional[httpx.AsyncClient] = None
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _build_client() -> httpx.AsyncClient:
+    """One pooled HTTP/2 client per process; auth is a client-level header."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(120.0, connect=5.0),
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=64,
+            max_keepalive_connections=32,
+            keepalive_expiry=120,
+        ),
+        headers={"Authorization": f"Bearer {llm_config.API_KEY}"},
+    )
 
 
 def _get_client() -> httpx.AsyncClient:
     global _client
     if _client is None or _client.is_closed:
-        _client = httpx.AsyncClient(timeout=120.0)
+        _client = _build_client()
     return _client
 
 
+def open_client() -> None:
+    """Create the shared client at startup so the first request doesn't pay for it."""
+    _get_client()
+
+
+async def close_client() -> None:
+    """Close the shared client and its pooled connections (called on shutdown)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
 # ─── Core Chat Completion ─────────────────────────────────
 
+def _completion_payload(
+    messages: List[Dict[str, str]],
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+    stream: bool = False,
+) -> bytes:
+    payload: Dict[str, Any] = {
+        "model": llm_config.MODEL,
+        "messages": messages,
+        "temperature": temperature if temperature is not None else llm_config.TEMPERATURE,
+        "max_tokens": max_tokens or llm_config.MAX_TOKENS,
+    }
+    if stream:
+        payload["stream"] = True
+    return orjson.dumps(payload)
+
+
+_MAX_BACKOFF = 30.0  # seconds
+
+
+def _backoff(attempt: int) -> float:
+    """Capped exponential backoff with jitter, so clients don't retry in lockstep."""
+    return min(_MAX_BACKOFF, llm_config.RETRY_DELAY * (2 ** (attempt - 1))) * (0.5 + random.random())
+
+
+def _retry_delay(exc: Exception, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying after *exc*, or None to give up."""
+    if attempt >= llm_config.RETRY_ATTEMPTS:
+        return None  # no retry left to wait for
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        if status == 429:
+            try:
+                # Honour Retry-After, but never past the backoff cap
+                retry_after = min(_MAX_BACKOFF, max(0.0, float(exc.response.headers["retry-after"])))
+            except (KeyError, ValueError):
+                retry_after = _backoff(attempt)
+            print(f"[LLM] Rate limit, retrying in {retry_after:.1f}s (attempt {attempt})")
+            return retry_after
+        if status >= 500:
+            delay = _backoff(attempt)
+            print(f"[LLM] Server error {status}, retrying in {delay:.1f}s")
+            return delay
+        return None
+    return _backoff(attempt)
+
+
 async def chat_completion(
     messages: List[Dict[str, str]],
     temperature: Optional[float] = None,
     max_tokens: Optional[int] = None,
 ) -> str:
     """Send a chat completion request to Groq with retry logic."""
-    temp = temperature if temperature is not None else llm_config.TEMPERATURE
-    tokens = max_tokens or llm_config.MAX_TOKENS
+    payload = _completion_payload(messages, temperature, max_tokens)
     last_error: Optional[Exception] = None
 
     for attempt in range(1, llm_config.RETRY_ATTEMPTS + 1):
@@ -152,55 +268,137 @@ async def chat_completion(
             client = _get_client()
             resp = await client.post(
                 f"{llm_config.API_URL}/chat/completions",
-                json={
-                    "model": llm_config.MODEL,
-                    "messages": messages,
-                    "temperature": temp,
-                    "max_tokens": tokens,
-                },
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {llm_config.API_KEY}",
-                },
+                content=payload,
+                headers=_JSON_HEADERS,
             )
             resp.raise_for_status()
-            return resp.json()["choices"][0]["message"]["content"]
+            return orjson.loads(resp.content)["choices"][0]["message"]["content"]
 
-        except httpx.HTTPStatusError as exc:
+        except Exception as exc:
             last_error = exc
-            status = exc.response.status_code
-            if status == 429:
-                retry_after = int(exc.response.headers.get("retry-after", llm_config.RETRY_DELAY))
-                print(f"[LLM] Rate limit, retrying in {retry_after}s (attempt {attempt})")
-                await asyncio.sleep(retry_after)
-                continue
-            if status >= 500 and attempt < llm_config.RETRY_ATTEMPTS:
-                delay = llm_config.RETRY_DELAY * (2 ** (attempt - 1))
-                print(f"[LLM] Server error {status}, retrying in {delay}s")
-                await asyncio.sleep(delay)
-                continue
-            break
+            delay = _retry_delay(exc, attempt)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+    raise ExternalServiceError("Groq LLM", str(last_error))
+
+
+async def chat_completion_stream(
+    messages: List[Dict[str, str]],
+    temperature: Optional[float] = None,
+    max_tokens: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """
+    Stream a chat completion from Groq, yielding content deltas as they arrive.
+    Retries follow chat_completion, but only until the first delta has been
+    yielded — a failure mid-stream is raised to the caller.
+    """
+    payload = _completion_payload(messages, temperature, max_tokens, stream=True)
+    last_error: Optional[Exception] = None
+
+    for attempt in range(1, llm_config.RETRY_ATTEMPTS + 1):
+        started = False
+        try:
+            client = _get_client()
+            async with client.stream(
+                "POST",
+                f"{llm_config.API_URL}/chat/completions",
+                content=payload,
+                headers=_JSON_HEADERS,
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[6:]
+                    if data.strip() == "[DONE]":
+                        break
+                    choices = orjson.loads(data).get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        started = True
+                        yield delta
+            return
 
         except Exception as exc:
             last_error = exc
-            if attempt < llm_config.RETRY_ATTEMPTS:
-                await asyncio.sleep(llm_config.RETRY_DELAY * (2 ** (attempt - 1)))
-                continue
-            break
+            delay = None if started else _retry_delay(exc, attempt)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
 
     raise ExternalServiceError("Groq LLM", str(last_error))
 
 
 # ─── High-level Helpers ───────────────────────────────────
 
-def _format_context(chunks: List[Dict], label: Optional[str] = None) -> str:
-    parts = []
-    for idx, chunk in enumerate(chunks):
-        fn = chunk.get("metadata", {}).get("filename", "unknown")
-        ci = chunk.get("metadata", {}).get("chunk_index", idx)
-        header = f"[{label} | {fn}, Chunk {ci}]" if label else f"[{fn}, Chunk {ci}]"
-        parts.append(f"{header}\n{chunk.get('text', '')}")
-    return "\n\n".join(parts)
+# Chunk-id orderings of recent answer prompts, most recent last (see _prefix_order)
+_RECENT_PROMPTS: "OrderedDict[Tuple, None]" = OrderedDict()
+_RECENT_PROMPTS_MAX = 64
+
+
+def _chunk_sort_key(chunk: Dict) -> Tuple[str, int]:
+    meta = chunk.get("metadata") or {}
+    return (meta.get("filename", ""), meta.get("chunk_index", 0))
+
+
+def _chunk_id(chunk: Dict):
+    return chunk.get("chunk_id") or _chunk_sort_key(chunk)
+
+
+def _prefix_order(chunks: List[Dict]) -> List[Dict]:
+    """
+    Order answer-context chunks to maximise prompt-prefix reuse (CacheWeaver-style
+    greedy walk): lead with the longest run of chunks that opened a recent prompt
+    and is fully contained in this set, then append the rest in stable order.
+    """
+    by_id = {_chunk_id(c): c for c in chunks}
+    best: Tuple = ()
+    for prev in reversed(_RECENT_PROMPTS):
+        n = 0
+        while n < len(prev) and prev[n] in by_id:
+            n += 1
+        if n > len(best):
+            best = prev[:n]
+
+    lead = set(best)
+    ordered = [by_id[cid] for cid in best]
+    ordered += sorted((c for c in chunks if _chunk_id(c) not in lead), key=_chunk_sort_key)
+
+    key = tuple(_chunk_id(c) for c in ordered)
+    _RECENT_PROMPTS[key] = None
+    _RECENT_PROMPTS.move_to_end(key)
+    if len(_RECENT_PROMPTS) > _RECENT_PROMPTS_MAX:
+        _RECENT_PROMPTS.popitem(last=False)
+    return ordered
+
+
+def _format_chunk(idx: int, chunk: Dict, label: Optional[str]) -> str:
+    meta = chunk.get("metadata") or {}
+    fn = meta.get("filename", "unknown")
+    ci = meta.get("chunk_index", idx)
+    header = f"[{label} | {fn}, Chunk {ci}]" if label else f"[{fn}, Chunk {ci}]"
+    return f"{header}\n{chunk.get('text', '')}"
+
+
+def _format_context(chunks: List[Dict], label: Optional[str] = None, presorted: bool = False) -> str:
+    """
+    Render chunks as labelled context. Unless *presorted*, chunks are put in
+    (filename, chunk_index) order so the same retrieved set always produces a
+    byte-identical prompt, regardless of retrieval rank.
+    """
+    if not presorted:
+        chunks = sorted(chunks, key=_chunk_sort_key)
+    return "\n\n".join(_format_chunk(idx, c, label) for idx, c in enumerate(chunks))
+
+
+def _answer_messages(query: str, context_chunks: List[Dict]) -> List[Dict[str, str]]:
+    ctx = _format_context(_prefix_order(context_chunks), presorted=True)
+    return [
+        _SYS_QUERY,
+        {"role": "user", "content": f"Context:\n{ctx}\n\n---\nQuestion: {query}"},
+    ]
 
 
 async def generate_answer(
@@ -209,14 +407,21 @@ async def generate_answer(
     temperature: Optional[float] = None,
 ) -> str:
     """Generate an answer using retrieved context."""
-    ctx = _format_context(context_chunks)
-    messages = [
-        {"role": "system", "content": QUERY_SYSTEM_PROMPT},
-        {"role": "user", "content": f"Context:\n{ctx}\n\n---\nQuestion: {query}"},
-    ]
+    messages = _answer_messages(query, context_chunks)
     return await chat_completion(messages, temperature=temperature)
 
 
+async def generate_answer_stream(
+    query: str,
+    context_chunks: List[Dict],
+    temperature: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """Streaming variant of generate_answer — yields the answer as it is decoded."""
+    messages = _answer_messages(query, context_chunks)
+    async for delta in chat_completion_stream(messages, temperature=temperature):
+        yield delta
+
+
 async def generate_comparison(
     topic: str,
     doc1_chunks: List[Dict],
@@ -226,7 +431,7 @@ async def generate_comparison(
     ctx1 = _format_context(doc1_chunks, "Document 1")
     ctx2 = _format_context(doc2_chunks, "Document 2")
     messages = [
-        {"role": "system", "content": COMPARE_SYSTEM_PROMPT},
+        _SYS_COMPARE,
         {"role": "user", "content": (
             f"Document 1 Context:\n{ctx1}\n\n---\n"
             f"Document 2 Context:\n{ctx2}\n\n---\n"
@@ -245,7 +450,7 @@ async def generate_structured_comparison(
     ctx1 = _format_context(doc1_chunks, "Document 1")
     ctx2 = _format_context(doc2_chunks, "Document 2")
     messages = [
-        {"role": "system", "content": COMPARE_STRUCTURED_SYSTEM_PROMPT},
+        _SYS_COMPARE_STRUCTURED,
         {"role": "user", "content": (
             f"Document 1 Context:\n{ctx1}\n\n---\n"
             f"Document 2 Context:\n{ctx2}\n\n---\n"
@@ -255,8 +460,7 @@ async def generate_structured_comparison(
     response = await chat_completion(messages, temperature=0.1, max_tokens=2500)
 
     try:
-        cleaned = re.sub(r"```json\n?|\n?```", "", response).strip()
-        parsed = json.loads(cleaned)
+        parsed = _parse_json_response(response)
         parsed.setdefault("metadata", {})
         parsed["metadata"].update({
             "doc1ChunksAnalyzed": len(doc1_chunks),
@@ -264,7 +468,7 @@ async def generate_structured_comparison(
             "topic": topic,
         })
         return parsed
-    except (json.JSONDecodeError, ValueError):
+    except ValueError:  # orjson.JSONDecodeError is a ValueError
         return {
             "similarities": [], "differences": [],
             "uniqueToDoc1": [], "uniqueToDoc2": [],
@@ -286,7 +490,7 @@ async def verify_answer(answer: str, context_chunks: List[Dict]) -> Dict:
     """Verify an answer against source chunks."""
     ctx = _format_context(context_chunks)
     messages = [
-        {"role": "system", "content": VERIFICATION_SYSTEM_PROMPT},
+        _SYS_VERIFICATION,
         {"role": "user", "content": (
             f"SOURCE CONTEXT:\n{ctx}\n\n---\n"
             f"ANSWER TO VERIFY:\n{answer}\n\n---\n"
@@ -295,9 +499,8 @@ async def verify_answer(answer: str, context_chunks: List[Dict]) -> Dict:
     ]
     response = await chat_completion(messages, temperature=0.1, max_tokens=1500)
     try:
-        cleaned = re.sub(r"```json\n?|\n?```", "", response).strip()
-        return json.loads(cleaned)
-    except (json.JSONDecodeError, ValueError):
+        return _parse_json_response(response)
+    except ValueError:  # orjson.JSONDecodeError is a ValueError
         return {
             "isVerified": False, "overallScore": 0,
             "claims": [], "unsupportedClaims": [],
@@ -313,23 +516,13 @@ def parse_confidence(response: str) -> Tuple[str, Dict]:
     Extract [CONFIDENCE: X/10 | REASON: ...] from the LLM response.
     Returns (cleaned_answer, confidence_dict).
     """
-    pattern = r"\[CONFIDENCE:\s*(\d+)/10\s*\|\s*REASON:\s*(.+?)\]\s*$"
-    match = re.search(pattern, response, re.IGNORECASE)
+    match = _CONF_RE.search(response)
 
     if match:
-        answer = re.sub(pattern, "", response, flags=re.IGNORECASE).strip()
+        answer = response[:match.start()].strip()
         score = int(match.group(1))
         reason = match.group(2).strip()
-        if score >= 9:
-            level = "very_high"
-        elif score >= 7:
-            level = "high"
-        elif score >= 5:
-            level = "medium"
-        elif score >= 3:
-            level = "low"
-        else:
-            level = "very_low"
+        level = _LEVELS[min(max(score, 1), 10) - 1]
         return answer, {"score": score, "reason": reason, "level": level}
 
     return response, {"score": None, "reason": "Confidence not provided", "level": "unknown"}
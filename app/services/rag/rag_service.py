@@ -3,16 +3,20 @@ RAG Orchestration Service
 Ties together: parse → chunk → embed → store → search → rerank → LLM answer.
 """
 import asyncio
+import functools
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 
+import numpy as np
+
+from app.config.indexing import IndexingConfig
 from app.services.embeddings import embedding_service
 from app.services.llm import llm_service
 from app.services.rag import rerank_service
 from app.vectorstore import vector_store_service
 from app.utils import cache_service
-from app.utils.document_parser import parse_document
+from app.utils.document_parser import Content, parse_document
 from app.utils.chunking_service import (
     chunk_text,
     create_chunk_metadata,
@@ -27,12 +31,15 @@ from app.utils.chunking_service import (
 
 async def ingest_document(
     filename: str,
-    content: bytes,
+    content: Content,
     chunk_size: Optional[int] = None,
     chunk_overlap: Optional[int] = None,
+    indexing: Optional[IndexingConfig] = None,
 ) -> Dict[str, Any]:
     """
     Full upload pipeline: parse → chunk → embed → store.
+    *content* may be raw bytes or a seekable binary file object.
+    Embedding and storage run as a pipeline tuned by *indexing*.
     """
     document_id = str(uuid.uuid4())
     start = time.time()
@@ -53,15 +60,12 @@ async def ingest_document(
     # 3. Create chunk metadata
     chunk_meta = create_chunk_metadata(document_id, filename, chunks)
 
-    # 4. Generate embeddings for all chunks (batched)
-    embeddings = await embedding_service.generate_embeddings_batched(chunks, batch_size=20)
-    print(f"[RAG]   Embedded: {len(embeddings)} vectors")
-
-    # 5. Store in ChromaDB
-    vector_store_service.store_chunks(chunk_meta, embeddings)
+    # 4-5. Embed and store in ChromaDB, overlapping the two stages
+    stored = await _index_chunks(document_id, chunk_meta, indexing or IndexingConfig())
+    print(f"[RAG]   Embedded + stored: {stored} vectors")
 
-    # 6. Invalidate query cache since corpus changed
-    cache_service.invalidate_queries()
+    # 6. Invalidate corpus-wide cached answers the new document could change
+    cache_service.invalidate_corpus_queries()
 
     elapsed = f"{time.time() - start:.2f}s"
     print(f"[RAG]   Ingestion complete in {elapsed}")
@@ -80,10 +84,111 @@ async def ingest_document(
     }
 
 
+async def _index_chunks(document_id: str, chunk_meta: List[Dict], cfg: IndexingConfig) -> int:
+    """
+    Embed and store chunks as a three-stage pipeline joined by bounded queues:
+    a producer slices length-sorted micro-batches, embed workers vectorise them, and a
+    writer stores each finished batch, so writes of batch i overlap with
+    embedding of batch i+1. ``None`` on a queue marks the end of a stage.
+    On any failure the stages are cancelled and the partial document removed.
+    """
+    n_workers = max(1, cfg.max_concurrent_batches)
+    embed_queue: asyncio.Queue = asyncio.Queue(maxsize=cfg.max_queue_size)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=cfg.max_queue_size)
+    stored = 0
+    uploaded_at = vector_store_service.upload_timestamp()  # one timestamp for every batch
+    writing: Optional[asyncio.Future] = None  # store_chunks call in its thread
+
+    # Smart batching: group similar-length chunks so each batch pads to a
+    # near-uniform length. Metadata travels with its text, so storage needs
+    # no un-permuting.
+    by_length = sorted(chunk_meta, key=lambda c: len(c["text"]))
+
+    async def produce():
+        for i in range(0, len(by_length), cfg.batch_size):
+            await embed_queue.put(by_length[i : i + cfg.batch_size])
+        for _ in range(n_workers):
+            await embed_queue.put(None)
+
+    async def embed():
+        while (batch := await embed_queue.get()) is not None:
+            texts = [c["text"] for c in batch]
+            embeddings = await embedding_service.generate_embeddings_batched(
+                texts, batch_size=cfg.batch_size
+            )
+            await write_queue.put((batch, embeddings))
+        await write_queue.put(None)
+
+    def store(batch: List[Dict], embeddings) -> None:
+        vector_store_service.store_chunks(batch, embeddings, uploaded_at, flush=False)
+        rerank_service.index_chunks(batch)  # BM25 tokenizing stays off the loop too
+
+    async def write():
+        nonlocal stored, writing
+        finished = 0
+        while finished < n_workers:
+            item = await write_queue.get()
+            if item is None:
+                finished += 1
+                continue
+            batch, embeddings = item
+            writing = asyncio.ensure_future(asyncio.to_thread(store, batch, embeddings))
+            # Shielded: a cancelled pipeline must not orphan a write mid-flight
+            await asyncio.shield(writing)
+            stored += len(batch)
+
+    tasks = [asyncio.create_task(produce()), asyncio.create_task(write())]
+    tasks += [asyncio.create_task(embed()) for _ in range(n_workers)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if writing is not None:
+            await asyncio.gather(writing, return_exceptions=True)
+            try:
+                await asyncio.to_thread(vector_store_service.delete_document, document_id)
+            except Exception as e:
+                # Surface the ingest error, not the cleanup one
+                print(f"[RAG]   Cleanup of partial document {document_id} failed: {e}")
+        raise
+    # Sidecar rewrite and search-cache clear once per document, not per batch
+    await asyncio.to_thread(vector_store_service.flush_writes)
+    return stored
+
+
 # ──────────────────────────────────────────────────────────
 # Query Pipeline
 # ──────────────────────────────────────────────────────────
 
+# Singleflight table: query key → task of the run currently answering it
+_inflight: Dict[Tuple, asyncio.Task] = {}
+
+
+def _run_done(key: Tuple, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # mark retrieved: no "never retrieved" warning without waiters
+
+
+async def _coalesced(key: Tuple, run: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Await the in-flight run for *key*, or start *run* and share its outcome.
+    The run is a detached task that every caller awaits through shield, so a
+    disconnecting client (even the one that started it) cancels only its own
+    wait, not the answer the others are waiting for.
+    """
+    task = _inflight.get(key)
+    if task is not None:
+        print("[RAG] Joining in-flight identical query")
+    else:
+        task = _inflight[key] = asyncio.ensure_future(run())
+        task.add_done_callback(functools.partial(_run_done, key))
+    return await asyncio.shield(task)
+
+
 async def query_documents(
     query: str,
     top_k: int = 5,
@@ -99,18 +204,143 @@ async def query_documents(
     """
     skip_cache = skip_cache or verify
     start = time.time()
+    cache_opts = {"top_k": top_k, "document_id": document_id, "rerank": rerank}
 
     # Check cache
     if not skip_cache:
-        cache_opts = {"top_k": top_k, "document_id": document_id, "rerank": rerank}
         cached = cache_service.get_query_result(query, cache_opts)
         if cached:
             print(f'[RAG] Query served from cache: "{query[:50]}..."')
             cached["processing_time"] = "0.00s (cached)"
             return cached
 
+    # Identical queries arriving while one is still running share its result
+    def pipeline():
+        return _query_pipeline(
+            query, top_k, document_id, temperature, include_metadata,
+            verify, rerank, skip_cache, cache_opts, start,
+        )
+
+    if skip_cache:
+        return await pipeline()
+    key = (cache_service.query_key(query, cache_opts), temperature, include_metadata)
+    return await _coalesced(key, pipeline)
+
+
+async def _query_pipeline(
+    query: str,
+    top_k: int,
+    document_id: Optional[str],
+    temperature: Optional[float],
+    include_metadata: bool,
+    verify: bool,
+    rerank: bool,
+    skip_cache: bool,
+    cache_opts: Dict,
+    start: float,
+) -> Dict[str, Any]:
     print(f'[RAG] Query: "{query[:80]}..." (topK={top_k}, verify={verify}, rerank={rerank})')
 
+    # 1-3. Embed, search, optionally re-rank
+    query_embedding, results = await _retrieve(query, top_k, document_id, rerank)
+    if not results:
+        return _no_results_response(query, start)
+
+    if not skip_cache:
+        hit = _semantic_hit(query, query_embedding, cache_opts, results, start)
+        if hit:
+            return hit
+
+    # 4-6. Generate answer, parse confidence, optionally verify
+    verification = None
+    if verify:
+        answer, confidence, verification = await _answer_and_verify(query, results, temperature)
+        v_status = "PASSED" if verification.get("isVerified") else "FAILED"
+        print(f"[RAG]   Verification: {v_status} ({verification.get('overallScore', 0)}/10)")
+    else:
+        raw_answer = await llm_service.generate_answer(query, results, temperature=temperature)
+        answer, confidence = llm_service.parse_confidence(raw_answer)
+
+    # 7. Build response with source citations
+    response = _query_response(
+        query, top_k, rerank, include_metadata, results, answer, confidence, verification, start,
+    )
+
+    # Cache result
+    if not skip_cache:
+        _cache_response(query, query_embedding, cache_opts, results, response)
+
+    return response
+
+
+async def query_documents_stream(
+    query: str,
+    top_k: int = 5,
+    document_id: Optional[str] = None,
+    temperature: Optional[float] = None,
+    include_metadata: bool = True,
+    verify: bool = False,
+    rerank: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of query_documents.
+    Yields {"type": "token", "delta": ...} events while the answer is decoded,
+    then a single {"type": "done", "data": <query_documents response>}.
+    """
+    skip_cache = verify
+    start = time.time()
+    cache_opts = {"top_k": top_k, "document_id": document_id, "rerank": rerank}
+
+    if not skip_cache:
+        cached = cache_service.get_query_result(query, cache_opts)
+        if cached:
+            print(f'[RAG] Query served from cache: "{query[:50]}..."')
+            cached["processing_time"] = "0.00s (cached)"
+            yield {"type": "done", "data": cached}
+            return
+
+    print(f'[RAG] Streaming query: "{query[:80]}..." (topK={top_k}, verify={verify}, rerank={rerank})')
+
+    query_embedding, results = await _retrieve(query, top_k, document_id, rerank)
+    if not results:
+        yield {"type": "done", "data": _no_results_response(query, start)}
+        return
+
+    if not skip_cache:
+        hit = _semantic_hit(query, query_embedding, cache_opts, results, start)
+        if hit:
+            yield {"type": "done", "data": hit}
+            return
+
+    parts: List[str] = []
+    async for delta in llm_service.generate_answer_stream(query, results, temperature=temperature):
+        parts.append(delta)
+        yield {"type": "token", "delta": delta}
+    answer, confidence = llm_service.parse_confidence("".join(parts))
+
+    verification = None
+    if verify:
+        print("[RAG]   Running answer verification...")
+        verification = await llm_service.verify_answer(answer, results)
+
+    response = _query_response(
+        query, top_k, rerank, include_metadata, results, answer, confidence, verification, start,
+    )
+    if not skip_cache:
+        _cache_response(query, query_embedding, cache_opts, results, response)
+    yield {"type": "done", "data": response}
+
+
+async def _retrieve(
+    query: str,
+    top_k: int,
+    document_id: Optional[str],
+    rerank: bool,
+) -> Tuple[np.ndarray, List[Dict]]:
+    """
+    Embed the query, search (extra candidates if reranking) and trim to top_k.
+    Returns the query embedding along with the results.
+    """
     # 1. Embed the query
     query_embedding = await embedding_service.generate_embedding(query)
 
@@ -121,36 +351,71 @@ async def query_documents(
     else:
         results = vector_store_service.search_similar(query_embedding, fetch_k)
 
-    if not results:
-        return {
-            "answer": "No relevant documents found. Please upload documents first.",
-            "confidence": {"score": 0, "reason": "No documents found", "level": "none"},
-            "sources": [], "query": query, "reranked": False,
-            "processing_time": f"{time.time() - start:.2f}s",
-        }
-
     # 3. Optionally re-rank
     if rerank and len(results) > 1:
         print(f"[RAG]   Re-ranking {len(results)} chunks...")
         results = rerank_service.rerank_chunks(query, results, top_n=top_k)
     elif len(results) > top_k:
         results = results[:top_k]
+    return query_embedding, results
 
-    # 4. Generate answer
-    raw_answer = await llm_service.generate_answer(query, results, temperature=temperature)
 
-    # 5. Parse confidence
-    answer, confidence = llm_service.parse_confidence(raw_answer)
+def _semantic_hit(
+    query: str,
+    query_embedding: np.ndarray,
+    cache_opts: Dict,
+    results: List[Dict],
+    start: float,
+) -> Optional[Dict[str, Any]]:
+    """Serve a near-duplicate query's answer if its evidence matches *results*."""
+    cached = cache_service.get_semantic_result(
+        query_embedding, cache_opts, [r["chunk_id"] for r in results]
+    )
+    if cached is None:
+        return None
+    print(f'[RAG] Query served from semantic cache: "{query[:50]}..."')
+    response = {**cached, "query": query, "processing_time": f"{time.time() - start:.2f}s (semantic cache)"}
+    cache_service.set_query_result(query, cache_opts, response)
+    return response
 
-    # 6. Optionally verify
-    verification = None
-    if verify:
-        print("[RAG]   Running answer verification...")
-        verification = await llm_service.verify_answer(answer, results)
-        v_status = "PASSED" if verification.get("isVerified") else "FAILED"
-        print(f"[RAG]   Verification: {v_status} ({verification.get('overallScore', 0)}/10)")
 
-    # 7. Build source citations
+def _cache_response(
+    query: str,
+    query_embedding: np.ndarray,
+    cache_opts: Dict,
+    results: List[Dict],
+    response: Dict[str, Any],
+) -> None:
+    cache_service.set_query_result(query, cache_opts, response)
+    cache_service.set_semantic_result(
+        query_embedding, cache_opts,
+        [r["chunk_id"] for r in results],
+        {r.get("metadata", {}).get("document_id") for r in results},
+        response,
+    )
+
+
+def _no_results_response(query: str, start: float) -> Dict[str, Any]:
+    return {
+        "answer": "No relevant documents found. Please upload documents first.",
+        "confidence": {"score": 0, "reason": "No documents found", "level": "none"},
+        "sources": [], "query": query, "reranked": False,
+        "processing_time": f"{time.time() - start:.2f}s",
+    }
+
+
+def _query_response(
+    query: str,
+    top_k: int,
+    rerank: bool,
+    include_metadata: bool,
+    results: List[Dict],
+    answer: str,
+    confidence: Dict,
+    verification: Optional[Dict],
+    start: float,
+) -> Dict[str, Any]:
+    """Assemble the query response, including source citations."""
     sources = []
     for r in results:
         meta = r.get("metadata", {})
@@ -165,7 +430,7 @@ async def query_documents(
             src["original_rank"] = r.get("original_rank")
         if include_metadata:
             text = r.get("text", "")
-            src["preview"] = text[:200] + ("..." if len(text) > 200 else "")
+            src["preview"] = text[:200] + "..." if len(text) > 200 else text
         sources.append(src)
 
     elapsed = f"{time.time() - start:.2f}s"
@@ -183,13 +448,56 @@ async def query_documents(
     }
     if verification:
         response["verification"] = verification
+    return response
 
-    # Cache result
-    if not skip_cache:
-        cache_opts = {"top_k": top_k, "document_id": document_id, "rerank": rerank}
-        cache_service.set_query_result(query, cache_opts, response)
 
-    return response
+_CONFIDENCE_MARKER = "[CONFIDENCE:"
+
+
+async def _answer_and_verify(
+    query: str,
+    results: List[Dict],
+    temperature: Optional[float],
+) -> Tuple[str, Dict, Dict]:
+    """
+    Stream the answer and start verification as soon as the answer body is
+    complete — the model emits the [CONFIDENCE: ...] line last, so the
+    verification round trip overlaps with decoding that trailing line.
+    """
+    parts: List[str] = []
+    seen = 0           # characters received before the current delta
+    tail = ""          # end of the previous window, in case the marker is split
+    early_body: Optional[str] = None
+    verify_task: Optional[asyncio.Task] = None
+
+    try:
+        async for delta in llm_service.generate_answer_stream(query, results, temperature=temperature):
+            parts.append(delta)
+            if verify_task is None:
+                window = tail + delta
+                pos = window.upper().find(_CONFIDENCE_MARKER)
+                if pos != -1:
+                    early_body = "".join(parts)[: seen - len(tail) + pos].strip()
+                    print("[RAG]   Running answer verification (answer body complete)...")
+                    verify_task = asyncio.create_task(llm_service.verify_answer(early_body, results))
+                tail = window[-(len(_CONFIDENCE_MARKER) - 1):]
+            seen += len(delta)
+    except BaseException:
+        if verify_task is not None:
+            verify_task.cancel()
+        raise
+
+    answer, confidence = llm_service.parse_confidence("".join(parts))
+
+    # Marker missing or malformed: the speculative check may not match the final answer
+    if verify_task is not None and early_body != answer:
+        verify_task.cancel()
+        verify_task = None
+    if verify_task is None:
+        print("[RAG]   Running answer verification...")
+        verify_task = asyncio.create_task(llm_service.verify_answer(answer, results))
+
+    return answer, confidence, await verify_task
 
 
 # ──────────────────────────────────────────────────────────
@@ -211,9 +519,12 @@ async def compare_documents(
     # 1. Embed topic
     topic_embedding = await embedding_service.generate_embedding(topic)
 
-    # 2. Search each document
-    doc1_results = vector_store_service.search_by_document(topic_embedding, document_ids[0], top_k)
-    doc2_results = vector_store_service.search_by_document(topic_embedding, document_ids[1], top_k)
+    # 2. Search each document concurrently (ChromaDB calls are blocking)
+    per_doc = await asyncio.gather(*[
+        asyncio.to_thread(vector_store_service.search_by_document, topic_embedding, doc_id, top_k)
+        for doc_id in document_ids
+    ])
+    doc1_results, doc2_results = per_doc[0], per_doc[1]
 
     if not doc1_results and not doc2_results:
         empty = {
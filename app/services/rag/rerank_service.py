@@ -6,10 +6,13 @@ with BM25-like term-frequency relevance for better retrieval quality.
 This lightweight approach avoids heavy ML model dependencies while
 still providing meaningful re-ranking of candidate chunks.
 """
-import math
+import os
 import re
-from collections import Counter
-from typing import Dict, List, Optional
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
 
 
 def rerank_chunks(
@@ -30,7 +33,8 @@ def rerank_chunks(
         keyword_weight: Weight for keyword score [0-1].
 
     Returns:
-        Re-ranked list of chunks with 'rerank_score' and 'original_rank' added.
+        Re-ranked list of the same chunk dicts, annotated in place with
+        'rerank_score', 'keyword_score' and 'original_rank'.
     """
     if not chunks:
         return []
@@ -43,29 +47,34 @@ def rerank_chunks(
     if not query_terms:
         return chunks
 
+    # Term counts come from the per-chunk table filled at ingest; only the
+    # query terms are looked up from them
+    q_set = set(query_terms)
+    terms = [_chunk_terms(c.get("chunk_id"), c.get("text", "")) for c in chunks]
+    term_counts = [tf for tf, _ in terms]
+
     # Compute IDF across the candidate set
     doc_freq: Counter = Counter()
-    for chunk in chunks:
-        tokens = set(_tokenize(chunk.get("text", "")))
-        for t in tokens:
-            doc_freq[t] += 1
+    for tf in term_counts:
+        doc_freq.update(t for t in q_set if t in tf)
     n_docs = len(chunks)
 
+    # BM25-like keyword scores, vectorized across candidates
+    kw_scores = _bm25_scores(query_terms, term_counts, [dl for _, dl in terms], doc_freq, n_docs)
+
     scored = []
     for rank, chunk in enumerate(chunks):
         # Vector similarity (already 0-1 from ChromaDB)
         vec_score = chunk.get("similarity_score", 0.0)
 
-        # BM25-like keyword score
-        kw_score = _bm25_score(query_terms, chunk.get("text", ""), doc_freq, n_docs)
+        kw_score = float(kw_scores[rank])
 
         combined = (vector_weight * vec_score) + (keyword_weight * kw_score)
-        scored.append({
-            **chunk,
-            "rerank_score": round(combined, 4),
-            "keyword_score": round(kw_score, 4),
-            "original_rank": rank + 1,
-        })
+        # Annotate in place: search results are fresh per query
+        chunk["rerank_score"] = round(combined, 4)
+        chunk["keyword_score"] = round(kw_score, 4)
+        chunk["original_rank"] = rank + 1
+        scored.append(chunk)
 
     # Sort by combined score descending
     scored.sort(key=lambda x: x["rerank_score"], reverse=True)
@@ -76,42 +85,74 @@ def rerank_chunks(
     return scored
 
 
+# ─── Chunk Term Table ─────────────────────────────────────
+# Chunk text never changes after ingest, so its term counts are computed
+# once and kept per chunk_id (ChromaDB metadata can't hold a dict). Chunks
+# missing from the table, e.g. after a restart, are tokenized on first
+# rerank and added. LRU-bounded; entries of deleted documents age out.
+
+MAX_TERM_TABLE = int(os.getenv("RERANK_TERM_CACHE_MAX", "50000"))
+
+_term_table: "OrderedDict[str, Tuple[Counter, int]]" = OrderedDict()  # chunk_id → (term counts, length)
+# Ingest fills the table from its writer thread while reranks read it on the loop
+_term_lock = threading.Lock()
+
+
+def index_chunks(chunks: Iterable[Dict]) -> None:
+    """Precompute term counts for newly stored chunks (dicts with chunk_id, text)."""
+    for c in chunks:
+        _chunk_terms(c["chunk_id"], c["text"])
+
+
+def _chunk_terms(chunk_id: Optional[str], text: str) -> Tuple[Counter, int]:
+    if chunk_id is not None:
+        with _term_lock:
+            entry = _term_table.get(chunk_id)
+            if entry is not None:
+                _term_table.move_to_end(chunk_id)
+                return entry
+    tokens = _tokenize(text)  # outside the lock
+    entry = (Counter(tokens), len(tokens))
+    if chunk_id is not None:
+        with _term_lock:
+            _term_table[chunk_id] = entry
+            if len(_term_table) > MAX_TERM_TABLE:
+                _term_table.popitem(last=False)
+    return entry
+
+
 # ─── Helpers ──────────────────────────────────────────────
 
+_RE_TOK = re.compile(r"\b\w+\b")
+
+
 def _tokenize(text: str) -> List[str]:
     """Simple whitespace + punctuation tokenizer with lowercasing."""
-    return [w.lower() for w in re.findall(r"\b\w+\b", text) if len(w) > 1]
+    return [w.lower() for w in _RE_TOK.findall(text) if len(w) > 1]
 
 
-def _bm25_score(
+def _bm25_scores(
     query_terms: List[str],
-    doc_text: str,
+    term_counts: List[Counter],
+    doc_lengths: List[int],
     doc_freq: Counter,
     n_docs: int,
     k1: float = 1.5,
     b: float = 0.75,
     avg_dl: float = 200.0,
-) -> float:
+) -> np.ndarray:
     """
-    Simplified BM25 relevance score.
+    Simplified BM25 relevance scores for all candidates at once, from a
+    (n_docs × n_query_terms) term-frequency matrix.
     """
-    doc_tokens = _tokenize(doc_text)
-    dl = len(doc_tokens)
-    if dl == 0:
-        return 0.0
-
-    tf_counter = Counter(doc_tokens)
-    score = 0.0
-
-    for term in query_terms:
-        tf = tf_counter.get(term, 0)
-        df = doc_freq.get(term, 0)
-        if tf == 0 or df == 0:
-            continue
-        idf = math.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
-        tf_norm = (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * (dl / avg_dl)))
-        score += idf * tf_norm
+    tf = np.array([[tc.get(t, 0) for t in query_terms] for tc in term_counts], dtype=np.float64)
+    df = np.array([doc_freq.get(t, 0) for t in query_terms], dtype=np.float64)
+    dl = np.array(doc_lengths, dtype=np.float64)
+
+    idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0)
+    tf_norm = (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * (dl[:, None] / avg_dl)))
+    scores = (idf * tf_norm).sum(axis=1)
 
     # Normalize to 0-1 range (approximate)
     max_possible = len(query_terms) * 3.0  # rough upper bound
-    return min(score / max_possible, 1.0) if max_possible > 0 else 0.0
+    return np.minimum(scores / max_possible, 1.0)
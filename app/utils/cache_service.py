@@ -3,14 +3,21 @@ Cache Service
 In-memory TTL caching for embeddings, query results, and document metadata.
 
 Cache tiers:
-  - Embeddings : 24 h TTL  (deterministic — text always maps to same vector)
-  - Queries    :  1 h TTL  (invalidated when corpus changes)
+  - Embeddings : 24 h TTL  (deterministic — text always maps to same vector;
+                            stored as raw float16/int8 bytes keyed by xxh3 hash)
+  - Queries    :  1 h TTL  (invalidated per affected document on corpus changes)
+  - Semantic   :  1 h TTL  (near-duplicate queries via LSH, evidence-gated)
   - Documents  : 30 min TTL
 """
-import hashlib
+import heapq
+import threading
 import time
 import os
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import xxhash
 
 # ─── Configuration ─────────────────────────────────────────
 
@@ -19,42 +26,70 @@ QUERY_TTL = int(os.getenv("QUERY_CACHE_TTL", 3600))             # 1 hour
 DOC_TTL = int(os.getenv("DOC_CACHE_TTL", 1800))                 # 30 min
 MAX_EMBEDDING_KEYS = int(os.getenv("EMBEDDING_CACHE_MAX", 10000))
 MAX_QUERY_KEYS = int(os.getenv("QUERY_CACHE_MAX", 1000))
+# Semantic cache gates: query cosine similarity and evidence (chunk-id) Jaccard
+SEMANTIC_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+SEMANTIC_MIN_OVERLAP = float(os.getenv("SEMANTIC_CACHE_MIN_OVERLAP", 0.8))
 
 
 class TTLCache:
-    """Simple dict-backed cache with per-key TTL and max-size eviction."""
-
-    def __init__(self, default_ttl: int, max_keys: int = 10000):
-        self._store: Dict[str, Tuple[Any, float]] = {}  # key → (value, expires_at)
+    """
+    LRU cache with per-key TTL and max-size eviction. Expirations sit in a
+    lazy min-heap, so sweeping expired keys costs O(log N) per expired entry
+    rather than a scan of the whole store. *on_remove(key, value)* is called
+    whenever an entry leaves by expiry, eviction, delete or overwrite (not
+    on flush), so side indexes can follow the cache.
+    """
+
+    def __init__(
+        self,
+        default_ttl: int,
+        max_keys: int = 10000,
+        on_remove: Optional[Callable[[Any, Any], None]] = None,
+    ):
+        self._store: "OrderedDict[Any, Tuple[Any, float]]" = OrderedDict()  # key → (value, expires_at)
+        self._expiry: List[Tuple[float, int, Any]] = []  # (expires_at, seq, key); may hold stale entries
+        self._seq = 0  # heap tie-breaker, so keys themselves are never compared
         self.default_ttl = default_ttl
         self.max_keys = max_keys
+        self._on_remove = on_remove
 
-    def get(self, key: str) -> Optional[Any]:
+    def get(self, key) -> Optional[Any]:
         entry = self._store.get(key)
         if entry is None:
             return None
         value, expires_at = entry
         if time.time() > expires_at:
             del self._store[key]
+            self._removed(key, value)
             return None
+        self._store.move_to_end(key)
         return value
 
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
-        if len(self._store) >= self.max_keys:
+    def set(self, key, value: Any, ttl: Optional[int] = None) -> None:
+        if key in self._store:
+            self._removed(key, self._store.pop(key)[0])
+        elif len(self._store) >= self.max_keys:
             self._evict_expired()
-        if len(self._store) >= self.max_keys:
-            # Evict oldest entry
-            oldest_key = next(iter(self._store))
-            del self._store[oldest_key]
-        self._store[key] = (value, time.time() + (ttl or self.default_ttl))
-
-    def delete(self, key: str) -> None:
-        self._store.pop(key, None)
+            if len(self._store) >= self.max_keys:
+                old_key, (old_value, _) = self._store.popitem(last=False)  # least recently used
+                self._removed(old_key, old_value)
+        expires_at = time.time() + (ttl or self.default_ttl)
+        self._store[key] = (value, expires_at)
+        self._seq += 1
+        heapq.heappush(self._expiry, (expires_at, self._seq, key))
+        if len(self._expiry) > 2 * self.max_keys:
+            self._compact()
+
+    def delete(self, key) -> None:
+        entry = self._store.pop(key, None)
+        if entry is not None:
+            self._removed(key, entry[0])
 
     def flush(self) -> None:
         self._store.clear()
+        self._expiry.clear()
 
-    def keys(self) -> List[str]:
+    def keys(self) -> List:
         self._evict_expired()
         return list(self._store.keys())
 
@@ -65,69 +100,296 @@ class TTLCache:
 
     def _evict_expired(self) -> None:
         now = time.time()
-        expired = [k for k, (_, exp) in self._store.items() if now > exp]
-        for k in expired:
-            del self._store[k]
+        heap = self._expiry
+        while heap and heap[0][0] < now:
+            expires_at, _, key = heapq.heappop(heap)
+            entry = self._store.get(key)
+            # Skip stale heap entries (key since overwritten, deleted or evicted)
+            if entry is not None and entry[1] == expires_at:
+                del self._store[key]
+                self._removed(key, entry[0])
+
+    def _removed(self, key, value) -> None:
+        if self._on_remove is not None:
+            self._on_remove(key, value)
+
+    def _compact(self) -> None:
+        # Rebuild the heap from live entries once stale ones dominate it
+        self._expiry = [(exp, i, k) for i, (k, (_, exp)) in enumerate(self._store.items())]
+        heapq.heapify(self._expiry)
+        self._seq = len(self._expiry)
 
 
 # ─── Cache Instances ───────────────────────────────────────
 
 _embedding_cache = TTLCache(EMBEDDING_TTL, MAX_EMBEDDING_KEYS)
-_query_cache = TTLCache(QUERY_TTL, MAX_QUERY_KEYS)
+# Removal hook keeps the query reverse indexes in step (defined further down)
+_query_cache = TTLCache(QUERY_TTL, MAX_QUERY_KEYS, on_remove=lambda k, v: _forget_query_key(k, v))
 _document_cache = TTLCache(DOC_TTL, 500)
 
 
 def _hash(text: str) -> str:
-    return hashlib.md5(text.encode()).hexdigest()
+    # Non-cryptographic: keys are opaque. Same 32-hex-char length as MD5.
+    return xxhash.xxh3_128_hexdigest(text.encode())
 
 
-def _build_query_key(query: str, opts: dict) -> str:
-    parts = "|".join([
-        query,
+def _query_scope(opts: dict) -> str:
+    return "|".join([
         str(opts.get("top_k", 5)),
         opts.get("document_id") or "all",
         "rerank" if opts.get("rerank") else "norerank",
     ])
-    return f"q:{_hash(parts)}"
 
 
-# ─── Embedding Cache ──────────────────────────────────────
+def _build_query_key(query: str, opts: dict) -> str:
+    return f"q:{_hash(query + '|' + _query_scope(opts))}"
+
 
-def get_embedding(text: str):
-    return _embedding_cache.get(f"emb:{_hash(text)}")
+# ─── Embedding Cache ──────────────────────────────────────
+# Keys are 64-bit xxh3 digests of the text (constant size, hashed at memory
+# speed; collisions are negligible at cache sizes). Values are raw vector
+# bytes, decoded zero-copy with np.frombuffer: float16 (default), or int8
+# with a float32 per-vector scale prefix (EMBEDDING_CACHE_DTYPE=int8) for
+# 4x more vectors per MB.
+
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16").lower()
+_SCALE = np.dtype(np.float32)
+
+
+def _embedding_key(text: str) -> int:
+    return xxhash.xxh3_64_intdigest(text.encode())
+
+if EMBEDDING_CACHE_DTYPE == "int8":
+    def _encode_embedding(embedding) -> bytes:
+        arr = np.asarray(embedding, dtype=np.float32)
+        scale = np.float32(np.abs(arr).max() / 127.0 or 1.0)
+        q = np.rint(arr / scale).astype(np.int8)
+        return scale.tobytes() + q.tobytes()
+
+    def _decode_embedding(blob: bytes) -> np.ndarray:
+        scale = np.frombuffer(blob, dtype=_SCALE, count=1)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=_SCALE.itemsize).astype(np.float32) * scale
+else:
+    def _encode_embedding(embedding) -> bytes:
+        # Normalized MiniLM vectors lose <0.1% recall at float16 precision
+        return np.asarray(embedding, dtype=np.float16).tobytes()
+
+    def _decode_embedding(blob: bytes) -> np.ndarray:
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+
+def get_embedding(text: str) -> Optional[np.ndarray]:
+    """Return the cached embedding as a float32 vector, or None."""
+    blob = _embedding_cache.get(_embedding_key(text))
+    return None if blob is None else _decode_embedding(blob)
 
 def set_embedding(text: str, embedding, ttl: Optional[int] = None):
-    _embedding_cache.set(f"emb:{_hash(text)}", embedding, ttl)
+    _embedding_cache.set(_embedding_key(text), _encode_embedding(embedding), ttl)
 
 def get_embeddings_batch(texts: List[str]):
+    keys = [_embedding_key(t) for t in texts]
     hits, misses = {}, []
-    for t in texts:
-        cached = get_embedding(t)
-        if cached is not None:
-            hits[t] = cached
+    for t, key in zip(texts, keys):
+        blob = _embedding_cache.get(key)
+        if blob is not None:
+            hits[t] = _decode_embedding(blob)
         else:
             misses.append(t)
     return hits, misses
 
 def set_embeddings_batch(mapping: dict):
     for text, emb in mapping.items():
-        set_embedding(text, emb)
+        _embedding_cache.set(_embedding_key(text), _encode_embedding(emb))
 
 
 # ─── Query Cache ──────────────────────────────────────────
+# Reverse indexes let corpus changes drop only the answers they can affect:
+# a deleted document invalidates the answers that cite it, and a new document
+# only the corpus-wide (unscoped) queries whose retrieval it could change.
+# Keys leave both indexes whenever the cache expires, evicts or replaces
+# them, so the indexes only ever reference live cache entries.
+
+_index_lock = threading.RLock()
+_doc_to_keys: Dict[str, Set[str]] = defaultdict(set)  # document_id → query keys citing it
+_corpus_keys: Set[str] = set()                         # keys of queries over all documents
+
+
+def query_key(query: str, opts: dict) -> str:
+    """Cache key of a query; also identifies identical in-flight queries."""
+    return _build_query_key(query, opts)
 
 def get_query_result(query: str, opts: dict = {}):
     return _query_cache.get(_build_query_key(query, opts))
 
+def _cited_documents(result: dict) -> Set[str]:
+    return {s.get("document_id") for s in result.get("sources", ())}
+
 def set_query_result(query: str, opts: dict, result: dict, ttl: Optional[int] = None):
-    _query_cache.set(_build_query_key(query, opts), result, ttl)
+    key = _build_query_key(query, opts)
+    with _index_lock:
+        _query_cache.set(key, result, ttl)
+        for doc_id in _cited_documents(result):
+            _doc_to_keys[doc_id].add(key)
+        if not opts.get("document_id"):
+            _corpus_keys.add(key)
 
 def invalidate_queries():
+    """Drop every cached answer (admin / full reset)."""
     _query_cache.flush()
+    with _index_lock:
+        _doc_to_keys.clear()
+        _corpus_keys.clear()
+
+def invalidate_corpus_queries():
+    """A document was added: drop answers of queries over the whole corpus."""
+    # Semantic entries survive: every hit re-checks fresh retrieval results
+    # against the cached evidence
+    with _index_lock:
+        keys = list(_corpus_keys)
+        _corpus_keys.clear()
+    for k in keys:
+        _query_cache.delete(k)
 
 def invalidate_document_queries(document_id: str):
-    # Flush all query cache when a document changes
-    _query_cache.flush()
+    """A document was deleted: drop only the answers that cite it."""
+    with _index_lock:
+        keys = _doc_to_keys.pop(document_id, ())
+    for k in keys:
+        _query_cache.delete(k)
+    _semantic_cache.invalidate_document(document_id)
+
+def _forget_query_key(key: str, result: dict):
+    # TTLCache removal hook: the key expired, was evicted or was deleted
+    with _index_lock:
+        _corpus_keys.discard(key)
+        for doc_id in _cited_documents(result):
+            keys = _doc_to_keys.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del _doc_to_keys[doc_id]
+
+
+# ─── Semantic Query Cache ─────────────────────────────────
+
+class SemanticCache:
+    """
+    Near-duplicate query cache. Query embeddings are bucketed by
+    random-projection LSH (*n_tables* signatures of *n_bits* sign bits); a
+    bucket candidate is served only if its cosine similarity to the new query
+    is >= *threshold* AND the chunks retrieved for the new query overlap the
+    cached answer's evidence (Jaccard >= *min_overlap*), so an answer is never
+    reused over evidence it was not grounded in.
+    """
+
+    def __init__(
+        self,
+        default_ttl: int,
+        max_keys: int,
+        threshold: float = 0.95,
+        min_overlap: float = 0.8,
+        n_tables: int = 8,
+        n_bits: int = 12,
+        seed: int = 0,
+    ):
+        # entry id → (unit embedding, chunk ids, document ids, result, scope,
+        # signatures); leaving the cache takes the id out of its buckets
+        self._entries = TTLCache(default_ttl, max_keys, on_remove=self._unbucket)
+        # one table per projection: (scope, signature) → entry ids
+        self._tables: List[Dict[Tuple[str, int], set]] = [{} for _ in range(n_tables)]
+        self._planes: Optional[np.ndarray] = None  # (n_tables, n_bits, dim), built on first use
+        self._rng = np.random.default_rng(seed)
+        self._bit_weights = 1 << np.arange(n_bits, dtype=np.int64)
+        self._n_tables, self._n_bits = n_tables, n_bits
+        self._next_id = 0
+        self.threshold = threshold
+        self.min_overlap = min_overlap
+
+    def get(self, embedding, scope: str, chunk_ids) -> Optional[dict]:
+        emb = _unit(embedding)
+        evidence = set(chunk_ids)
+        best, best_sim = None, self.threshold
+        seen = set()
+        for table, sig in zip(self._tables, self._signatures(emb)):
+            bucket = table.get((scope, sig))
+            if not bucket:
+                continue
+            for eid in list(bucket):
+                if eid in seen:
+                    continue
+                seen.add(eid)
+                entry = self._entries.get(eid)
+                if entry is None:  # just expired; the removal hook unbucketed it
+                    continue
+                cached_emb, cached_ids, _, result = entry[:4]
+                sim = float(cached_emb @ emb)
+                if sim >= best_sim and _jaccard(evidence, cached_ids) >= self.min_overlap:
+                    best, best_sim = result, sim
+        return best
+
+    def set(self, embedding, scope: str, chunk_ids, document_ids, result: dict) -> None:
+        emb = _unit(embedding)
+        sigs = self._signatures(emb)
+        eid = self._next_id
+        self._next_id += 1
+        self._entries.set(eid, (emb, frozenset(chunk_ids), frozenset(document_ids), result, scope, sigs))
+        for table, sig in zip(self._tables, sigs):
+            table.setdefault((scope, sig), set()).add(eid)
+
+    def invalidate_document(self, document_id: str) -> None:
+        """Drop entries whose evidence includes chunks of *document_id*."""
+        for eid in self._entries.keys():
+            entry = self._entries.get(eid)
+            if entry is not None and document_id in entry[2]:
+                self._entries.delete(eid)
+
+    def flush(self) -> None:
+        self._entries.flush()
+        for table in self._tables:
+            table.clear()
+
+    def _unbucket(self, eid: int, entry: tuple) -> None:
+        # TTLCache removal hook: expired, evicted or invalidated entry
+        scope, sigs = entry[4], entry[5]
+        for table, sig in zip(self._tables, sigs):
+            bucket = table.get((scope, sig))
+            if bucket is not None:
+                bucket.discard(eid)
+                if not bucket:
+                    del table[(scope, sig)]
+
+    @property
+    def size(self) -> int:
+        return self._entries.size
+
+    def _signatures(self, emb: np.ndarray) -> List[int]:
+        if self._planes is None:
+            self._planes = self._rng.standard_normal(
+                (self._n_tables, self._n_bits, emb.shape[0])
+            ).astype(np.float32)
+        bits = (self._planes @ emb) > 0             # (n_tables, n_bits)
+        return (bits @ self._bit_weights).tolist()  # one int signature per table
+
+
+def _unit(embedding) -> np.ndarray:
+    emb = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(emb)
+    return emb / norm if norm > 0 else emb
+
+
+def _jaccard(a: set, b: frozenset) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+
+_semantic_cache = SemanticCache(QUERY_TTL, MAX_QUERY_KEYS, SEMANTIC_THRESHOLD, SEMANTIC_MIN_OVERLAP)
+
+
+def get_semantic_result(embedding, opts: dict, chunk_ids) -> Optional[dict]:
+    """Cached result for a near-duplicate query whose evidence still matches."""
+    return _semantic_cache.get(embedding, _query_scope(opts), chunk_ids)
+
+def set_semantic_result(embedding, opts: dict, chunk_ids, document_ids, result: dict):
+    _semantic_cache.set(embedding, _query_scope(opts), chunk_ids, document_ids, result)
 
 
 # ─── Document Cache ───────────────────────────────────────
@@ -145,10 +407,12 @@ def get_stats() -> dict:
     return {
         "embeddings": _embedding_cache.size,
         "queries": _query_cache.size,
+        "semantic_queries": _semantic_cache.size,
         "documents": _document_cache.size,
     }
 
 def flush_all():
     _embedding_cache.flush()
     _query_cache.flush()
+    _semantic_cache.flush()
     _document_cache.flush()
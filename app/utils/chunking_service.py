@@ -4,7 +4,7 @@ Splits documents into overlapping chunks with sentence-boundary awareness.
 """
 import os
 import re
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 DEFAULT_CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))        # characters
 DEFAULT_CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "100"))  # characters
@@ -49,10 +49,9 @@ def chunk_text(
 
         # Single sentence exceeds chunk size → force-split by characters
         if s_len > size:
+            # (no overlap carried: the force-split pieces restart the window)
             if current_chunk:
                 chunks.append(" ".join(current_chunk))
-                current_chunk = _get_overlap_sentences(current_chunk, overlap)
-                current_len = sum(len(s) for s in current_chunk) + max(len(current_chunk) - 1, 0)
             chunks.extend(_force_split(sentence, size, overlap))
             current_chunk = []
             current_len = 0
@@ -62,8 +61,7 @@ def chunk_text(
         sep_len = 1 if current_chunk else 0  # space separator
         if current_len + sep_len + s_len > size and current_chunk:
             chunks.append(" ".join(current_chunk))
-            current_chunk = _get_overlap_sentences(current_chunk, overlap)
-            current_len = sum(len(s) for s in current_chunk) + max(len(current_chunk) - 1, 0)
+            current_chunk, current_len = _get_overlap_sentences(current_chunk, overlap)
 
         current_chunk.append(sentence)
         current_len += (1 if current_len > 0 else 0) + s_len
@@ -103,27 +101,31 @@ def create_chunk_metadata(
 
 # ─── Helpers ──────────────────────────────────────────────
 
+_RE_SENT = re.compile(r"(?<=[.!?])\s+")
+
+
 def _split_into_sentences(text: str) -> List[str]:
-    parts = re.split(r"(?<=[.!?])\s+", text)
-    return [s.strip() for s in parts if s.strip()]
+    # Boundary scan happens in the C regex engine; strip each piece once
+    return [t for s in _RE_SENT.split(text) if (t := s.strip())]
 
 
 def _count_words(text: str) -> int:
-    if not text or not text.strip():
-        return 0
-    return len(text.strip().split())
+    # str.split() already ignores leading/trailing whitespace
+    return len(text.split()) if text else 0
 
 
-def _get_overlap_sentences(sentences: List[str], overlap_chars: int) -> List[str]:
+def _get_overlap_sentences(sentences: List[str], overlap_chars: int) -> Tuple[List[str], int]:
+    """Trailing sentences fitting in *overlap_chars*, plus their joined length."""
     result: List[str] = []
     char_count = 0
     for s in reversed(sentences):
         sl = len(s)
         if char_count + sl > overlap_chars:
             break
-        result.insert(0, s)
+        result.append(s)
         char_count += sl
-    return result
+    result.reverse()
+    return result, char_count + max(len(result) - 1, 0)
 
 
 def _force_split(text: str, size: int, overlap: int) -> List[str]:
@@ -2,24 +2,115 @@
 Document Parser
 Extracts raw text from PDF, DOCX, TXT, and Markdown files.
 """
+import asyncio
+import concurrent.futures
+import io
+import mmap
+import multiprocessing
 import os
 import re
-from typing import Union
+from typing import BinaryIO, List, Optional, Union
 
-import PyPDF2
-import docx
-import markdown
+# Parser libraries (pypdfium2, PyPDF2, python-docx) are imported inside the
+# functions that use them: query-only workers never load them, and a
+# deployment that only ingests TXT/Markdown doesn't need them installed.
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt", ".md", ".markdown"}
 
+# PDFium is not thread-safe (pypdfium2 serialises calls), so large PDFs are
+# split into page ranges across a persistent process pool.
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
 
-async def parse_document(filename: str, content: bytes) -> str:
+# Real tags only (letter after "<", one line): a bare "a < b" or "x -> y" is text
+_RE_TAG = re.compile(r"</?[A-Za-z][^<>\n]*>")
+_RE_ENTITY = re.compile(r"&[a-z]+;", re.I)
+_RE_WS = re.compile(r"\s+")
+# Fenced code block: the fence lines are dropped, the code is kept verbatim
+_RE_MD_FENCE = re.compile(
+    r"^[ \t]*(```|~~~)[^\n]*\n?(.*?)(?:^[ \t]*\1[ \t]*$|\Z)", re.M | re.S
+)
+# Markdown → plain text, applied directly to the source outside code fences
+# (no HTML round-trip)
+_MD_STRIP = [
+    (re.compile(r"^[ \t]*\[[^\]\n]+\]:[ \t]*\S+.*$", re.M), ""),         # reference definitions
+    (re.compile(r"^[ \t]{0,3}#{1,6}[ \t]+|[ \t]+#+[ \t]*$", re.M), ""),  # ATX headings
+    (re.compile(r"^[ \t]*(?:[=\-]{2,}|[*_]{3,})[ \t]*$", re.M), ""),     # setext underlines / rules
+    (re.compile(r"^[ \t]*>[ \t]?", re.M), ""),                          # blockquotes
+    (re.compile(r"^[ \t]*(?:[-*+]|\d+[.)])[ \t]+", re.M), ""),           # list markers
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),                       # images → alt text
+    (re.compile(r"\[([^\]]+)\](?:\([^)]*\)|\[[^\]]*\])"), r"\1"),          # links → text
+    (re.compile(r"`+([^`]*)`+"), r"\1"),                                # inline code
+    # Emphasis only where CommonMark would see it: the opening delimiter is
+    # followed, and the closing one preceded, by non-space (so "a * b * c"
+    # or "x ** y" keep their asterisks), and "_" never matches inside words.
+    (re.compile(r"(?<!\*)(\*\*|~~)(?!\s)(.+?)(?<!\s)\1(?!\*)"
+                r"|(?<!\w)__(?!\s)(.+?)(?<!\s)__(?!\w)"), r"\2\3"),          # bold / strikethrough
+    (re.compile(r"(?<!\*)\*(?![\s*])(.+?)(?<![\s*])\*(?!\*)"
+                r"|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)"), r"\1\2"),           # italics
+]
+_RE_CTRL = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F]")
+_RE_NL3 = re.compile(r"\n{3,}")
+_RE_SP = re.compile(r"[ \t]+")
+
+Content = Union[bytes, BinaryIO]
+
+
+def _content_size(content: Content) -> int:
+    if isinstance(content, (bytes, bytearray)):
+        return len(content)
+    pos = content.tell()
+    size = content.seek(0, io.SEEK_END)
+    content.seek(pos)
+    return size
+
+
+def _as_stream(content: Content) -> BinaryIO:
+    if isinstance(content, (bytes, bytearray)):
+        return io.BytesIO(content)
+    content.seek(0)
+    return content
+
+
+def _decode_text(content: Content) -> str:
+    """
+    UTF-8 decode without first copying the upload into a bytes object:
+    in-memory buffers are decoded through a memoryview, on-disk files
+    through a read-only mmap.
+    """
+    if isinstance(content, (bytes, bytearray)):
+        return content.decode("utf-8", errors="replace")
+    # SpooledTemporaryFile keeps its buffer in ._file (BytesIO until rolled
+    # over); calling fileno() on it directly would force a rollover to disk
+    raw = getattr(content, "_file", content)
+    if isinstance(raw, io.BytesIO):
+        with raw.getbuffer() as view:
+            return str(view, "utf-8", "replace")
+    try:
+        fd = raw.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return _as_bytes(content).decode("utf-8", errors="replace")
+    raw.flush()
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+        return str(mm, "utf-8", "replace")
+
+
+def _as_bytes(content: Content) -> bytes:
+    if isinstance(content, (bytes, bytearray)):
+        return bytes(content)
+    content.seek(0)
+    return content.read()
+
+
+async def parse_document(filename: str, content: Content) -> str:
     """
     Detect file type and extract plain text.
 
     Args:
         filename: Original filename (used for extension detection).
-        content: Raw file bytes.
+        content: Raw file bytes, or a seekable binary file object. PDF and
+                 DOCX parsers read the file object directly without first
+                 copying it into memory.
 
     Returns:
         Extracted plain text.
@@ -27,10 +118,11 @@ async def parse_document(filename: str, content: bytes) -> str:
     Raises:
         ValueError: Unsupported file type or empty document.
     """
-    if not content:
+    size = _content_size(content) if content is not None else 0
+    if not size:
         raise ValueError("Invalid file: no content provided")
 
-    size_kb = len(content) / 1024
+    size_kb = size / 1024
     print(f'[Parser] Processing "{filename}" ({size_kb:.1f} KB)')
 
     ext = os.path.splitext(filename)[1].lower()
@@ -41,11 +133,11 @@ async def parse_document(filename: str, content: bytes) -> str:
         )
 
     if ext == ".pdf":
-        text = _parse_pdf(content)
+        text = await _parse_pdf(content)
     elif ext == ".docx":
         text = _parse_docx(content)
     elif ext == ".txt":
-        text = content.decode("utf-8", errors="replace")
+        text = _decode_text(content)
     elif ext in (".md", ".markdown"):
         text = _parse_markdown(content)
     else:
@@ -59,41 +151,133 @@ async def parse_document(filename: str, content: bytes) -> str:
 
 # ─── Individual Parsers ───────────────────────────────────
 
-def _parse_pdf(content: bytes) -> str:
-    """Extract text from a PDF buffer."""
-    import io
+async def _parse_pdf(content: Content) -> str:
+    """
+    Extract text from a PDF buffer or file object with PDFium (PyPDF2 as a
+    fallback). PDFs with at least PDF_PARALLEL_MIN_PAGES pages are extracted
+    in parallel page ranges.
+    """
     try:
-        reader = PyPDF2.PdfReader(io.BytesIO(content))
-        pages = [page.extract_text() or "" for page in reader.pages]
+        n_pages = _pdf_page_count(content)
+        if n_pages < PDF_PARALLEL_MIN_PAGES or PDF_PARSE_WORKERS < 2:
+            pages = _extract_page_range(_as_stream(content), 0, n_pages)
+        else:
+            # Each worker opens its own document on the bytes and extracts
+            # only its range (page handles can't cross processes)
+            data = _as_bytes(content)
+            step = -(-n_pages // PDF_PARSE_WORKERS)
+            loop = asyncio.get_running_loop()
+            pool = _get_pdf_pool()
+            ranges = await asyncio.gather(*[
+                loop.run_in_executor(pool, _extract_pages, data, i, min(i + step, n_pages))
+                for i in range(0, n_pages, step)
+            ])
+            pages = [text for r in ranges for text in r]
         return "\n".join(pages)
     except Exception as e:
         raise ValueError(f"PDF parsing failed: {e}")
 
 
-def _parse_docx(content: bytes) -> str:
-    """Extract text from a DOCX buffer."""
-    import io
+def _pdf_page_count(content: Content) -> int:
+    import pypdfium2 as pdfium
     try:
-        doc = docx.Document(io.BytesIO(content))
+        pdf = pdfium.PdfDocument(_as_stream(content))
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    except pdfium.PdfiumError:
+        import PyPDF2
+        return len(PyPDF2.PdfReader(_as_stream(content)).pages)
+
+
+def _extract_page_range(stream: BinaryIO, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop): PDFium, or PyPDF2 if PDFium can't read it."""
+    import pypdfium2 as pdfium
+    try:
+        pdf = pdfium.PdfDocument(stream)
+        try:
+            pages = []
+            for i in range(start, stop):
+                page = pdf[i]
+                textpage = page.get_textpage()
+                pages.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return pages
+        finally:
+            pdf.close()  # frees the native document
+    except pdfium.PdfiumError:
+        import PyPDF2
+        stream.seek(0)
+        reader = PyPDF2.PdfReader(stream)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def _parse_docx(content: Content) -> str:
+    """Extract text from a DOCX buffer or file object."""
+    import docx
+    try:
+        doc = docx.Document(_as_stream(content))
         return "\n".join(p.text for p in doc.paragraphs)
     except Exception as e:
         raise ValueError(f"DOCX parsing failed: {e}")
 
 
-def _parse_markdown(content: bytes) -> str:
-    """Convert Markdown to plain text (strip tags)."""
-    raw = content.decode("utf-8", errors="replace")
-    html = markdown.markdown(raw)
-    text = re.sub(r"<[^>]+>", " ", html)       # strip HTML tags
-    text = re.sub(r"&[a-z]+;", " ", text, flags=re.I)  # strip entities
-    text = re.sub(r"\s+", " ", text)
-    return text.strip()
+def _parse_markdown(content: Content) -> str:
+    """Convert Markdown to plain text (strip syntax and inline HTML)."""
+    text = _decode_text(content)
+    parts: List[str] = []
+    pos = 0
+    for fence in _RE_MD_FENCE.finditer(text):
+        parts.append(_strip_markdown(text[pos : fence.start()]))
+        parts.append(fence.group(2))
+        pos = fence.end()
+    parts.append(_strip_markdown(text[pos:]))
+    return _RE_WS.sub(" ", " ".join(parts)).strip()
+
+
+def _strip_markdown(text: str) -> str:
+    """Markdown syntax, inline HTML and entities out of prose (no code fences)."""
+    for pattern, repl in _MD_STRIP:
+        text = pattern.sub(repl, text)
+    text = _RE_TAG.sub(" ", text)         # strip inline HTML tags
+    return _RE_ENTITY.sub(" ", text)      # strip entities
 
 
 def _clean_text(text: str) -> str:
     """Normalize whitespace and remove control characters."""
     text = text.replace("\r\n", "\n")
-    text = re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F]", "", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    text = re.sub(r"[ \t]+", " ", text)
+    text = _RE_CTRL.sub("", text)
+    text = _RE_NL3.sub("\n\n", text)
+    text = _RE_SP.sub(" ", text)
     return text.strip()
+
+
+# ─── PDF Worker Pool ──────────────────────────────────────
+
+_pdf_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+
+def _get_pdf_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        # spawn, not fork: the server process runs ORT / HTTP threads
+        _pdf_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=PDF_PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pdf_pool
+
+
+def shutdown_pdf_pool() -> None:
+    """Stop the PDF worker processes (called on app shutdown)."""
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
+
+
+def _extract_pages(data: bytes, start: int, stop: int) -> List[str]:
+    """Worker: extract text of pages [start, stop) from the PDF bytes."""
+    return _extract_page_range(io.BytesIO(data), start, stop)
@@ -3,7 +3,7 @@ Centralized Error Handling
 Custom exception classes + FastAPI exception handlers.
 """
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from app.utils.json_response import ORJSONResponse
 
 
 # ─── Custom Exception Classes ──────────────────────────────
@@ -44,7 +44,7 @@ class RateLimitError(AppError):
 
 # ─── FastAPI Exception Handlers ────────────────────────────
 
-async def app_error_handler(request: Request, exc: AppError) -> JSONResponse:
+async def app_error_handler(request: Request, exc: AppError) -> ORJSONResponse:
     """Handle all custom AppError subclasses."""
     body: dict = {
         "success": False,
@@ -54,12 +54,12 @@ async def app_error_handler(request: Request, exc: AppError) -> JSONResponse:
         body["error"]["details"] = exc.details
     if isinstance(exc, RateLimitError):
         body["error"]["retryAfter"] = exc.retry_after
-    return JSONResponse(status_code=exc.status_code, content=body)
+    return ORJSONResponse(status_code=exc.status_code, content=body)
 
 
-async def generic_error_handler(request: Request, exc: Exception) -> JSONResponse:
+async def generic_error_handler(request: Request, exc: Exception) -> ORJSONResponse:
     """Catch-all for unhandled exceptions."""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "success": False,
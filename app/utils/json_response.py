@@ -0,0 +1,15 @@
+"""
+JSON Response
+orjson-backed JSONResponse used as the app's default response class.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """Serialize with orjson (bytes out, handles numpy arrays natively)."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
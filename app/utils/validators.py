@@ -2,9 +2,18 @@
 Request Validators
 Pydantic models for validating incoming requests.
 """
+import re
 from typing import List, Optional
-from pydantic import BaseModel, Field, field_validator
-import uuid
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# Canonical hyphenated form, as produced by str(uuid.uuid4()) at ingest
+_UUID_RE = re.compile(
+    r"\A[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\Z"
+)
+
+
+def is_uuid(value: str) -> bool:
+    return _UUID_RE.match(value) is not None
 
 
 class UploadParams(BaseModel):
@@ -15,6 +24,8 @@ class UploadParams(BaseModel):
 
 class QueryRequest(BaseModel):
     """POST /api/query body."""
+    model_config = ConfigDict(frozen=True)
+
     query: str = Field(..., min_length=1, max_length=5000)
     top_k: int = Field(5, ge=1, le=20)
     document_id: Optional[str] = None
@@ -31,15 +42,15 @@ class QueryRequest(BaseModel):
         # Treat Swagger placeholders and empty strings as "not provided"
         if not v or not v.strip() or v.strip().lower() == "string":
             return None
-        try:
-            uuid.UUID(v)
-        except ValueError:
+        if not is_uuid(v):
             raise ValueError("document_id must be a valid UUID")
         return v
 
 
 class CompareRequest(BaseModel):
     """POST /api/compare body."""
+    model_config = ConfigDict(frozen=True)
+
     document_ids: List[str] = Field(..., min_length=2, max_length=2)
     topic: str = Field(..., min_length=1, max_length=2000)
     top_k: int = Field(5, ge=1, le=20)
@@ -51,8 +62,6 @@ class CompareRequest(BaseModel):
         if len(v) != 2:
             raise ValueError("Exactly two document IDs are required for comparison")
         for doc_id in v:
-            try:
-                uuid.UUID(doc_id)
-            except ValueError:
+            if not is_uuid(doc_id):
                 raise ValueError(f"Invalid UUID: {doc_id}")
         return v
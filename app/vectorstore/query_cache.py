@@ -0,0 +1,151 @@
+"""
+Query Cache
+Thread-safe LRU + TTL cache of vector search results, keyed by the float16-
+quantized query embedding, top_k, where-filter and included fields. A
+generation counter in every key is bumped on each write, so results computed
+before a store or delete can never be served after it.
+
+Beyond exact key matches it is a similarity cache: cached query vectors sit
+L2-normalized in one contiguous (max_size, d) float32 matrix, and a miss is
+answered from the closest cached query with the same top_k/filter/fields
+when its cosine similarity is at least the configured threshold — a single
+matrix-vector product over the cache instead of an HNSW walk.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Key = Tuple[int, bytes, int, str]
+
+
+def _unit(q16: bytes) -> np.ndarray:
+    v = np.frombuffer(q16, dtype=np.float16).astype(np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+class QueryCache:
+    """LRU similarity cache of search results with TTL expiry and write invalidation."""
+
+    def __init__(self, max_size: int = 2000, ttl: float = 300, similarity: float = 0.97):
+        self._store: "OrderedDict[Key, Tuple[List[Dict], float, int]]" = OrderedDict()  # key → (results, expires_at, slot)
+        self._lock = threading.RLock()
+        self._generation = 0
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        # Slot-addressed vector table; _scopes[slot] is -1 for free slots
+        self._matrix: Optional[np.ndarray] = None
+        self._scopes = np.full(max_size, -1, dtype=np.int64)
+        self._slot_keys: List[Optional[Key]] = [None] * max_size
+        self._scope_ids: Dict[Tuple[int, str], int] = {}
+        self._free = list(range(max_size - 1, -1, -1))
+
+    def key(
+        self,
+        query_embedding: Any,
+        top_k: int,
+        where_filter: Optional[Dict],
+        include: Sequence[str] = (),
+    ) -> Key:
+        """Build a key; take it *before* querying so a racing write invalidates it."""
+        q = np.asarray(query_embedding, dtype=np.float16).tobytes()
+        where = json.dumps(where_filter, sort_keys=True) if where_filter else ""
+        # Filter and included fields together form the scope a result is valid for
+        return (self._generation, q, top_k, f"{where}|{','.join(sorted(include))}")
+
+    def get(self, key: Key) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._store.get(key)
+            exact = entry is not None
+            if not exact:
+                near = self._nearest(key)
+                if near is not None:
+                    key, entry = near, self._store[near]
+            if entry is None or time.monotonic() > entry[1]:
+                if entry is not None:
+                    self._release(self._store.pop(key)[2])
+                self.misses += 1
+                return None
+            self._store.move_to_end(key)
+            if exact:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            # Callers annotate result dicts (rerank scores), so hand out copies
+            return [dict(r) for r in entry[0]]
+
+    def set(self, key: Key, results: List[Dict]) -> None:
+        with self._lock:
+            if key[0] != self._generation:
+                return  # a write landed while this search ran
+            entry = self._store.get(key)
+            if entry is not None:
+                slot = entry[2]
+            else:
+                q = _unit(key[1])
+                if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                    self._reset(q.shape[0])
+                if not self._free:
+                    self._release(self._store.popitem(last=False)[1][2])  # least recently used
+                slot = self._free.pop()
+                self._matrix[slot] = q
+                self._scopes[slot] = self._scope_ids.setdefault((key[2], key[3]), len(self._scope_ids))
+                self._slot_keys[slot] = key
+            self._store[key] = ([dict(r) for r in results], time.monotonic() + self.ttl, slot)
+            self._store.move_to_end(key)
+
+    def invalidate(self) -> None:
+        """Drop every entry; called after any write to the collection."""
+        with self._lock:
+            self._generation += 1
+            self._reset(None if self._matrix is None else self._matrix.shape[1])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.near_hits + self.misses
+            return {
+                "size": len(self._store),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.near_hits) / total, 4) if total else 0.0,
+                "similarity_threshold": self.similarity,
+                "generation": self._generation,
+            }
+
+    def _nearest(self, key: Key) -> Optional[Key]:
+        """Key of the most similar cached query in the same scope, if above threshold."""
+        if self._matrix is None or self.similarity > 1:
+            return None
+        sid = self._scope_ids.get((key[2], key[3]))
+        q = _unit(key[1])
+        if sid is None or q.shape[0] != self._matrix.shape[1]:
+            return None
+        sims = self._matrix @ q
+        sims[self._scopes != sid] = -1.0
+        best = int(np.argmax(sims))
+        if sims[best] < self.similarity:
+            return None
+        return self._slot_keys[best]
+
+    def _release(self, slot: int) -> None:
+        self._scopes[slot] = -1
+        self._slot_keys[slot] = None
+        self._free.append(slot)
+
+    def _reset(self, dim: Optional[int]) -> None:
+        self._store.clear()
+        self._matrix = None if dim is None else np.zeros((self.max_size, dim), dtype=np.float32)
+        self._scopes.fill(-1)
+        self._slot_keys = [None] * self.max_size
+        self._scope_ids.clear()
+        self._free = list(range(self.max_size - 1, -1, -1))
@@ -3,159 +3,448 @@ Vector Store Service
 Manages ChromaDB collection: store, search, delete embeddings.
 Uses PersistentClient — no separate ChromaDB server process needed.
 """
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
 import chromadb
+import numpy as np
+from collections import Counter
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from operator import itemgetter
+from typing import Dict, List, Optional, Sequence, Union
 
 from app.config import database as db_config
+from app.vectorstore.query_cache import QueryCache
 from app.utils.error_handler import ExternalServiceError
 
+logger = logging.getLogger("vectorstore")
+
 _client: Optional[chromadb.ClientAPI] = None
 _collection = None
 
+# Per-document summary (filename, chunk_count, uploaded_at) kept in step with
+# store/delete so listing never scans the collection; mirrored to a sidecar.
+_doc_index: Dict[str, Dict] = {}
+_index_lock = threading.RLock()
+
+# Repeated / near-identical searches skip the HNSW walk; cleared on every write
+_search_cache = QueryCache(
+    db_config.SEARCH_CACHE_MAX,
+    db_config.SEARCH_CACHE_TTL,
+    db_config.SEARCH_CACHE_SIMILARITY,
+)
+
+
+def _index_path() -> str:
+    return os.path.join(db_config.CHROMA_PERSIST_DIR, "_doc_index.json")
+
 
 def initialize():
     """Initialize ChromaDB PersistentClient and ensure collection exists."""
     global _client, _collection
+    _get_collection.cache_clear()  # drop any handle from a previous client
     try:
+        if db_config.SQLITE_WAL:
+            _enable_wal()
         _client = chromadb.PersistentClient(path=db_config.CHROMA_PERSIST_DIR)
         _collection = _client.get_or_create_collection(
             name=db_config.CHROMA_COLLECTION,
-            metadata={"hnsw:space": db_config.DISTANCE_FUNCTION},
+            metadata={
+                "hnsw:space": db_config.DISTANCE_FUNCTION,
+                "hnsw:M": db_config.HNSW_M,
+                "hnsw:construction_ef": db_config.HNSW_EF_CONSTRUCTION,
+                "hnsw:search_ef": db_config.HNSW_EF_SEARCH,
+                "hnsw:batch_size": db_config.HNSW_BATCH_SIZE,
+                "hnsw:sync_threshold": db_config.HNSW_SYNC_THRESHOLD,
+            },
         )
+        _apply_search_ef(_collection)
         count = _collection.count()
-        print(f'[VectorStore] Connected to ChromaDB. Collection "{db_config.CHROMA_COLLECTION}" has {count} vectors.')
+        _load_doc_index(count)
+        logger.info('Connected to ChromaDB. Collection "%s" has %d vectors.', db_config.CHROMA_COLLECTION, count)
+        if count:
+            _warm_index(_collection)
         return _collection
     except Exception as e:
         raise ExternalServiceError("ChromaDB", f"Initialization failed: {e}")
 
 
+def _warm_index(col) -> None:
+    """
+    Run one throwaway query so Chroma loads the HNSW graph (and the OS pages
+    it in) at startup rather than on the first user search.
+    """
+    warm = np.random.default_rng().standard_normal(db_config.EMBEDDING_DIM, dtype=np.float32)
+    warm /= np.linalg.norm(warm)
+    start = time.perf_counter()
+    try:
+        col.query(query_embeddings=warm.reshape(1, -1), n_results=1, include=["distances"])
+        logger.info("HNSW index warmed in %.0f ms", (time.perf_counter() - start) * 1000)
+    except Exception as e:
+        # e.g. EMBEDDING_DIM doesn't match the stored vectors; searches still work
+        logger.warning("HNSW warm-up query failed: %s", e)
+
+
+def _enable_wal() -> None:
+    """
+    Switch chroma.sqlite3 to WAL: writers append to the log instead of
+    rewriting pages under a rollback journal, and readers don't block on them.
+    The journal mode is stored in the database file, so this persists for
+    Chroma's own connections; per-connection pragmas (synchronous, mmap_size,
+    cache_size) would not and are left alone. Must run before the client
+    opens the file — switching under Chroma's live connections corrupts reads.
+    """
+    path = os.path.join(db_config.CHROMA_PERSIST_DIR, "chroma.sqlite3")
+    try:
+        os.makedirs(db_config.CHROMA_PERSIST_DIR, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5)
+        try:
+            if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+                conn.execute("PRAGMA journal_mode=WAL")
+                logger.info("SQLite journal mode set to WAL")
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Could not enable SQLite WAL: %s", e)
+
+
+def _apply_search_ef(col) -> None:
+    """Bring a pre-existing collection's ef_search in line with the config."""
+    hnsw = (col.configuration or {}).get("hnsw") or {}
+    if hnsw.get("ef_search", db_config.HNSW_EF_SEARCH) == db_config.HNSW_EF_SEARCH:
+        return
+    try:
+        col.modify(configuration={"hnsw": {"ef_search": db_config.HNSW_EF_SEARCH}})
+        logger.info("HNSW ef_search %s → %d", hnsw["ef_search"], db_config.HNSW_EF_SEARCH)
+    except Exception as e:
+        logger.warning("Could not update HNSW ef_search: %s", e)
+
+
+@functools.cache
 def _get_collection():
-    """Lazy-initialize and return the collection."""
-    global _collection
+    """
+    Lazy-initialize and return the collection. Memoized, so hot paths pay a
+    C-level cache hit rather than a global lookup and None check per call;
+    initialize() clears it whenever the handle is replaced.
+    """
     if _collection is None:
         initialize()
     return _collection
 
 
+# ─── Document Index ───────────────────────────────────────
+
+def _load_doc_index(count: int) -> None:
+    """Load the sidecar; rebuild from Chroma if missing or out of step with *count*."""
+    global _doc_index
+    with _index_lock:
+        try:
+            with open(_index_path(), "rb") as f:
+                index = json.load(f)
+            if sum(d["chunk_count"] for d in index.values()) == count:
+                _doc_index = index
+                return
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+        _rebuild_doc_index()
+
+
+def _rebuild_doc_index() -> None:
+    """Aggregate the index with one full metadata scan (startup only)."""
+    global _doc_index
+    metas = _collection.get(include=["metadatas"])["metadatas"] or []
+    # Counting and first-seen lookup both run in C: Counter's counting loop
+    # and dict(zip(...)) over the reversed rows (first occurrence wins).
+    ids = list(map(itemgetter("document_id"), metas))
+    first = dict(zip(reversed(ids), reversed(metas)))
+    index: Dict[str, Dict] = {
+        did: {
+            "document_id": did,
+            "filename": first[did].get("filename"),
+            "chunk_count": n,
+            "uploaded_at": first[did].get("uploaded_at"),
+        }
+        for did, n in Counter(ids).items()
+    }
+    with _index_lock:
+        _doc_index = index
+        _persist_doc_index()
+    logger.info("Rebuilt document index (%d documents)", len(index))
+
+
+def _persist_doc_index() -> None:
+    """Write the sidecar atomically. Caller holds _index_lock."""
+    path = _index_path()
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_doc_index, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        # The sidecar is only a startup shortcut; a stale one is rebuilt
+        logger.warning("Could not persist document index: %s", e)
+
+
 # ─── Store ────────────────────────────────────────────────
 
-def store_chunks(chunk_metadata: List[Dict], embeddings: List[List[float]]) -> None:
-    """Store document chunk embeddings in ChromaDB (batched)."""
-    col = _get_collection()
-    batch_size = db_config.BATCH_SIZE
+def _chunk_metadatas(batch_meta: List[Dict], uploaded_at: str) -> List[Dict]:
+    """
+    Chroma metadata records for a batch. Copying a per-document template
+    (a fixed-size memcpy) and setting the two per-chunk fields is cheaper
+    than building each six-key dict from scratch.
+    """
+    metadatas: List[Dict] = []
+    append = metadatas.append
+    template: Dict = {}
+    doc_id = None
+    for c in batch_meta:
+        if c["document_id"] != doc_id:
+            doc_id = c["document_id"]
+            template = {
+                "document_id": doc_id,
+                "filename": c["filename"],
+                "chunk_index": 0,
+                "total_chunks": c["total_chunks"],
+                "word_count": 0,
+                "uploaded_at": uploaded_at,
+            }
+        meta = template.copy()
+        meta["chunk_index"] = c["chunk_index"]
+        meta["word_count"] = c["word_count"]
+        append(meta)
+    return metadatas
 
-    for i in range(0, len(chunk_metadata), batch_size):
-        batch_meta = chunk_metadata[i : i + batch_size]
-        batch_emb = embeddings[i : i + batch_size]
 
-        try:
+def upload_timestamp() -> str:
+    """
+    Current UTC time as a second-precision ISO string. It is repeated in
+    every chunk's metadata row, and microseconds would add 7 bytes to each
+    for no use.
+    """
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+def _index_batch(batch_meta: List[Dict], uploaded_at: str) -> None:
+    """Count a stored batch into the document index."""
+    with _index_lock:
+        for c in batch_meta:
+            entry = _doc_index.get(c["document_id"])
+            if entry is None:
+                entry = _doc_index[c["document_id"]] = {
+                    "document_id": c["document_id"],
+                    "filename": c["filename"],
+                    "chunk_count": 0,
+                    "uploaded_at": uploaded_at,
+                }
+            entry["chunk_count"] += 1
+
+
+def store_chunks(
+    chunk_metadata: List[Dict],
+    embeddings: Union[np.ndarray, List[List[float]]],
+    uploaded_at: Optional[str] = None,
+    flush: bool = True,
+) -> None:
+    """
+    Store document chunk embeddings in ChromaDB (batched).
+    All chunks share one *uploaded_at* ISO timestamp (default: now); callers
+    storing a document over several calls pass the same value to each, and
+    may pass flush=False and call flush_writes() once after the last call
+    instead of persisting the index and clearing the search cache every time.
+    """
+    if not chunk_metadata:
+        return
+    col = _get_collection()
+    batch_size = db_config.BATCH_SIZE
+    uploaded_at = uploaded_at or upload_timestamp()
+    # One contiguous float32 (n, d) buffer; batches below are zero-copy views
+    # of it, so the binding never unboxes nested Python floats
+    emb_arr = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if emb_arr.ndim != 2 or len(emb_arr) != len(chunk_metadata):
+        raise ValueError(
+            f"Expected {len(chunk_metadata)} embeddings of shape (n, d), got {emb_arr.shape}"
+        )
+    try:
+        for i in range(0, len(chunk_metadata), batch_size):
+            batch_meta = chunk_metadata[i : i + batch_size]
             col.add(
                 ids=[c["chunk_id"] for c in batch_meta],
-                embeddings=batch_emb,
+                embeddings=emb_arr[i : i + batch_size],
                 documents=[c["text"] for c in batch_meta],
-                metadatas=[
-                    {
-                        "document_id": c["document_id"],
-                        "filename": c["filename"],
-                        "chunk_index": c["chunk_index"],
-                        "total_chunks": c["total_chunks"],
-                        "word_count": c["word_count"],
-                        "uploaded_at": datetime.now(timezone.utc).isoformat(),
-                    }
-                    for c in batch_meta
-                ],
+                metadatas=_chunk_metadatas(batch_meta, uploaded_at),
             )
-        except Exception as e:
-            raise ExternalServiceError("ChromaDB", f"Failed to store chunks: {e}")
+            _index_batch(batch_meta, uploaded_at)
+    except Exception as e:
+        raise ExternalServiceError("ChromaDB", f"Failed to store chunks: {e}")
+    finally:
+        if flush:
+            flush_writes()
+
+    if flush:
+        logger.info("Stored %d chunks for document %s", len(chunk_metadata), chunk_metadata[0]["document_id"])
 
-    doc_id = chunk_metadata[0]["document_id"] if chunk_metadata else "?"
-    print(f"[VectorStore] Stored {len(chunk_metadata)} chunks for document {doc_id}")
+
+def flush_writes() -> None:
+    """Persist the document index and drop cached searches after stores."""
+    _search_cache.invalidate()
+    with _index_lock:
+        _persist_doc_index()
 
 
 # ─── Search ───────────────────────────────────────────────
 
-def search_similar(
-    query_embedding: List[float],
+_FULL_INCLUDE = ("documents", "metadatas", "distances")
+
+
+def _build_hits(results: Dict, k: int = 0) -> List[Dict]:
+    """Result dicts for the k-th query, with only the fields Chroma returned."""
+    if not results["ids"] or not results["ids"][k]:
+        return []
+    ids = results["ids"][k]
+    texts = (results.get("documents") or [None] * (k + 1))[k]
+    metas = (results.get("metadatas") or [None] * (k + 1))[k]
+    dists = (results.get("distances") or [None] * (k + 1))[k]
+    if texts is not None and metas is not None and dists is not None:
+        # Default include: one zip over the bound columns, no per-field checks
+        return [
+            {
+                "chunk_id": chunk_id,
+                "text": text,
+                "metadata": meta,
+                "distance": dist,
+                "similarity_score": 1 - dist,
+            }
+            for chunk_id, text, meta, dist in zip(ids, texts, metas, dists)
+        ]
+    hits: List[Dict] = []
+    for idx, chunk_id in enumerate(ids):
+        hit: Dict = {"chunk_id": chunk_id}
+        if texts is not None:
+            hit["text"] = texts[idx]
+        if metas is not None:
+            hit["metadata"] = metas[idx]
+        if dists is not None:
+            hit["distance"] = dists[idx]
+            hit["similarity_score"] = 1 - dists[idx]
+        hits.append(hit)
+    return hits
+
+
+def search_similar_batch(
+    query_embeddings: Union[np.ndarray, List[List[float]]],
     top_k: int = 5,
     where_filter: Optional[Dict] = None,
-) -> List[Dict]:
-    """Search for similar chunks across all documents."""
+    include: Optional[Sequence[str]] = None,
+) -> List[List[Dict]]:
+    """
+    Search several query vectors with one collection query (multi-hop /
+    multi-query retrieval). Returns one result list per query, in order.
+    Cached queries are answered from the search cache; only the misses go
+    to Chroma.
+    """
     col = _get_collection()
+    include = tuple(include) if include is not None else _FULL_INCLUDE
+    qs = np.asarray(query_embeddings, dtype=np.float32)
+    if not qs.size:
+        # No queries, or zero-length vectors: still one (empty) list per query
+        return [[] for _ in range(len(qs) if qs.ndim > 1 else 0)]
+    if qs.ndim == 1:
+        qs = qs.reshape(1, -1)
+    keys = [_search_cache.key(q, top_k, where_filter, include) for q in qs]
+    out: List[Optional[List[Dict]]] = [_search_cache.get(key) for key in keys]
+    misses = [i for i, hits in enumerate(out) if hits is None]
+    if not misses:
+        return out
     try:
         params: Dict = {
-            "query_embeddings": [query_embedding],
+            "query_embeddings": np.ascontiguousarray(qs[misses]),
             "n_results": top_k,
-            "include": ["documents", "metadatas", "distances"],
+            "include": list(include),
         }
         if where_filter:
             params["where"] = where_filter
 
         results = col.query(**params)
-
-        if not results["ids"] or not results["ids"][0]:
-            return []
-
-        return [
-            {
-                "chunk_id": results["ids"][0][idx],
-                "text": results["documents"][0][idx],
-                "metadata": results["metadatas"][0][idx],
-                "distance": results["distances"][0][idx],
-                "similarity_score": 1 - results["distances"][0][idx],
-            }
-            for idx in range(len(results["ids"][0]))
-        ]
     except Exception as e:
         raise ExternalServiceError("ChromaDB", f"Search failed: {e}")
+    for k, i in enumerate(misses):
+        out[i] = _build_hits(results, k)
+        _search_cache.set(keys[i], out[i])
+    return out
+
+
+def search_similar(
+    query_embedding: Union[np.ndarray, List[float]],
+    top_k: int = 5,
+    where_filter: Optional[Dict] = None,
+    include: Optional[Sequence[str]] = None,
+) -> List[Dict]:
+    """
+    Search for similar chunks across all documents.
+    *include* narrows what Chroma fetches (default: documents, metadatas,
+    distances); callers that only score IDs pass ["distances"] to skip the
+    text/metadata lookups and decoding.
+    """
+    return search_similar_batch([query_embedding], top_k, where_filter, include)[0]
 
 
 def search_by_document(
-    query_embedding: List[float],
+    query_embedding: Union[np.ndarray, List[float]],
     document_id: str,
     top_k: int = 5,
+    include: Optional[Sequence[str]] = None,
 ) -> List[Dict]:
     """Search chunks scoped to a specific document."""
-    return search_similar(query_embedding, top_k, {"document_id": document_id})
+    return search_similar(query_embedding, top_k, {"document_id": document_id}, include)
 
 
 # ─── Delete ───────────────────────────────────────────────
 
 def delete_document(document_id: str) -> None:
-    """Delete all chunks belonging to a document."""
+    """
+    Delete all chunks belonging to a document, one page of IDs at a time so
+    each delete call holds Chroma's write lock only briefly and searches can
+    interleave between pages.
+    """
     col = _get_collection()
+    page = min(db_config.DELETE_BATCH_SIZE, _client.get_max_batch_size())
+    where = {"document_id": document_id}
+    deleted = 0
     try:
-        col.delete(where={"document_id": document_id})
-        print(f"[VectorStore] Deleted all chunks for document {document_id}")
+        while True:
+            ids = col.get(where=where, limit=page, include=[])["ids"]
+            if not ids:
+                break
+            col.delete(ids=ids)
+            deleted += len(ids)
+            time.sleep(0)  # yield the GIL to waiting request threads
+        logger.info("Deleted %d chunks for document %s", deleted, document_id)
     except Exception as e:
         raise ExternalServiceError("ChromaDB", f"Delete failed: {e}")
+    finally:
+        if deleted:
+            _search_cache.invalidate()
+    with _index_lock:
+        if _doc_index.pop(document_id, None) is not None:
+            _persist_doc_index()
 
 
 # ─── List / Stats ─────────────────────────────────────────
 
 def list_documents() -> List[Dict]:
-    """List all unique documents in the collection."""
-    col = _get_collection()
-    try:
-        all_data = col.get(include=["metadatas"])
-        if not all_data["ids"]:
-            return []
-
-        doc_map: Dict[str, Dict] = {}
-        for meta in all_data["metadatas"]:
-            did = meta["document_id"]
-            if did not in doc_map:
-                doc_map[did] = {
-                    "document_id": did,
-                    "filename": meta.get("filename"),
-                    "chunk_count": 0,
-                    "uploaded_at": meta.get("uploaded_at"),
-                }
-            doc_map[did]["chunk_count"] += 1
+    """List all unique documents in the collection (served from the document index)."""
+    _get_collection()
+    with _index_lock:
+        return [dict(d) for d in _doc_index.values()]
 
-        return list(doc_map.values())
-    except Exception as e:
-        raise ExternalServiceError("ChromaDB", f"List failed: {e}")
+
+def get_cache_stats() -> Dict:
+    """Search-result cache counters."""
+    return _search_cache.stats()
 
 
 def get_stats() -> Dict:
@@ -18,6 +18,7 @@ load_dotenv()
 if sys.version_info >= (3, 14):
     warnings.filterwarnings("ignore", message=".*Pydantic V1.*Python 3.14.*")
     try:
+        import typing
         import pydantic.v1.fields as _pv1_fields
 
         _orig_set_default_and_type = _pv1_fields.ModelField._set_default_and_type
@@ -28,7 +29,6 @@ if sys.version_info >= (3, 14):
             except _pv1_fields.errors_.ConfigError:
                 # Fall back: use the outer_type_ or annotation directly
                 if self.type_ is _pv1_fields.Undefined:
-                    import typing
                     hint = getattr(self, 'outer_type_', None)
                     if hint is None or hint is _pv1_fields.Undefined:
                         # last resort: set to Any
@@ -55,4 +55,12 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=port,
         reload=False,
+        # uvloop (libuv event loop) and httptools (C HTTP parser) come with
+        # uvicorn[standard]; uvloop has no Windows build
+        loop="uvloop" if sys.platform != "win32" else "asyncio",
+        http="httptools",
+        # Defaults to one process: the ChromaDB PersistentClient and the
+        # in-process caches are not shared across worker processes
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        log_level="info",
     )
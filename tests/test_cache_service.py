@@ -0,0 +1,104 @@
+"""
+Cache Service tests
+Run with: python -m unittest discover tests
+"""
+import time
+import unittest
+
+import numpy as np
+
+from app.utils import cache_service as cs
+
+
+def _answer(*doc_ids):
+    return {"answer": "a", "sources": [{"document_id": d} for d in doc_ids]}
+
+
+def _indexed_keys() -> int:
+    return len(cs._corpus_keys) + sum(map(len, cs._doc_to_keys.values()))
+
+
+class QueryIndexTest(unittest.TestCase):
+    def setUp(self):
+        cs.invalidate_queries()
+
+    def test_document_scoped_queries_keep_index_bounded(self):
+        for i in range(5 * cs.MAX_QUERY_KEYS):
+            doc = f"doc-{i % 50}"
+            cs.set_query_result(f"question {i}", {"document_id": doc}, _answer(doc))
+        self.assertEqual(cs._query_cache.size, cs.MAX_QUERY_KEYS)
+        self.assertFalse(cs._corpus_keys)
+        self.assertEqual(_indexed_keys(), cs.MAX_QUERY_KEYS)
+
+    def test_corpus_queries_keep_index_bounded(self):
+        for i in range(3 * cs.MAX_QUERY_KEYS):
+            cs.set_query_result(f"question {i}", {}, _answer(f"doc-{i % 7}", "doc-x"))
+        self.assertEqual(len(cs._corpus_keys), cs.MAX_QUERY_KEYS)
+        self.assertEqual(sum(map(len, cs._doc_to_keys.values())), 2 * cs.MAX_QUERY_KEYS)
+
+    def test_expired_keys_leave_index(self):
+        cs.set_query_result("short", {"document_id": "d"}, _answer("d"), ttl=1)
+        time.sleep(1.1)
+        self.assertIsNone(cs.get_query_result("short", {"document_id": "d"}))
+        self.assertEqual(_indexed_keys(), 0)
+
+    def test_overwrite_reindexes_cited_documents(self):
+        cs.set_query_result("q", {}, _answer("old"))
+        cs.set_query_result("q", {}, _answer("new"))
+        self.assertNotIn("old", cs._doc_to_keys)
+        self.assertEqual(len(cs._doc_to_keys["new"]), 1)
+
+    def test_document_invalidation(self):
+        cs.set_query_result("q1", {}, _answer("a", "b"))
+        cs.set_query_result("q2", {}, _answer("b"))
+        cs.invalidate_document_queries("a")
+        self.assertIsNone(cs.get_query_result("q1", {}))
+        self.assertIsNotNone(cs.get_query_result("q2", {}))
+        self.assertEqual(cs._doc_to_keys["b"], {cs.query_key("q2", {})})
+
+
+
+class SemanticCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(1)
+
+    def _bucketed(self, cache) -> int:
+        return sum(len(b) for table in cache._tables for b in table.values())
+
+    def _fill(self, cache, n, doc="doc"):
+        for i in range(n):
+            emb = self.rng.standard_normal(32)
+            cache.set(emb, "5|all|norerank", [f"c{i}"], [doc], {"answer": i})
+
+    def test_bucket_membership_bounded_by_live_entries(self):
+        cache = cs.SemanticCache(default_ttl=60, max_keys=3)
+        self._fill(cache, 2000)
+        self.assertEqual(cache.size, 3)
+        self.assertLessEqual(self._bucketed(cache), 3 * cache._n_tables)
+
+    def test_expired_entries_leave_buckets(self):
+        cache = cs.SemanticCache(default_ttl=1, max_keys=100)
+        self._fill(cache, 50)
+        time.sleep(1.1)
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(self._bucketed(cache), 0)
+        self.assertFalse(any(cache._tables))
+
+    def test_document_invalidation_leaves_buckets(self):
+        cache = cs.SemanticCache(default_ttl=60, max_keys=100)
+        self._fill(cache, 10, doc="gone")
+        self._fill(cache, 5, doc="kept")
+        cache.invalidate_document("gone")
+        self.assertEqual(cache.size, 5)
+        self.assertEqual(self._bucketed(cache), 5 * cache._n_tables)
+
+    def test_near_duplicate_hit(self):
+        cache = cs.SemanticCache(default_ttl=60, max_keys=10)
+        emb = self.rng.standard_normal(32)
+        cache.set(emb, "s", ["c1", "c2"], ["d"], {"answer": "x"})
+        self.assertEqual(cache.get(emb * 1.01, "s", ["c1", "c2"]), {"answer": "x"})
+        self.assertIsNone(cache.get(emb, "other-scope", ["c1", "c2"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Document Parser tests
+Run with: python -m unittest discover tests
+"""
+import unittest
+
+from app.utils.document_parser import _parse_markdown
+
+
+def md(text: str) -> str:
+    return _parse_markdown(text.encode())
+
+
+class MarkdownEmphasisTest(unittest.TestCase):
+    def test_emphasis_is_stripped(self):
+        self.assertEqual(md("*it* and **bold** and __u__ and _i_"), "it and bold and u and i")
+        self.assertEqual(md("***both*** ~~gone~~"), "both gone")
+        self.assertEqual(md("**a*b*c**"), "abc")
+
+    def test_literal_asterisks_are_kept(self):
+        self.assertEqual(md("a * b * c"), "a * b * c")
+        self.assertEqual(md("2 * 3 = 6 and 4 * 5"), "2 * 3 = 6 and 4 * 5")
+        self.assertEqual(md("x ** y ** z"), "x ** y ** z")
+        self.assertEqual(md("a *b * c"), "a *b * c")
+
+    def test_intraword_underscores_are_kept(self):
+        self.assertEqual(md("snake_case_name and file_*.py"), "snake_case_name and file_*.py")
+
+
+class MarkdownTextTest(unittest.TestCase):
+    def test_bare_angle_brackets_are_kept(self):
+        self.assertEqual(
+            md("If a < b then swap.\n\nLots of important text here.\n\nThen x -> y."),
+            "If a < b then swap. Lots of important text here. Then x -> y.",
+        )
+        self.assertEqual(
+            md("Use `a < b` in code.\n\nMiddle paragraph.\n\nArrow => done"),
+            "Use a < b in code. Middle paragraph. Arrow => done",
+        )
+
+    def test_inline_html_tags_are_stripped(self):
+        self.assertEqual(md("<b>bold</b> and <br/> <a href='x'>link</a>"), "bold and link")
+
+    def test_fenced_code_is_kept_verbatim(self):
+        src = "# Title\n\n```python\n# compute\n- not a list\nx = a*b*c  # C #\n```\n\n- item"
+        self.assertEqual(md(src), "Title # compute - not a list x = a*b*c # C # item")
+        self.assertEqual(md("~~~\n# a\n~~~\n# b"), "# a b")
+        self.assertEqual(md("```\nunclosed # x\n- y"), "unclosed # x - y")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+"""
+LLM Service tests
+Run with: python -m unittest discover tests
+"""
+import unittest
+
+import httpx
+
+from app.config import llm as llm_config
+from app.services.llm import llm_service as llm
+
+
+def _status_error(status: int, **headers) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://llm.test/chat/completions")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class RetryDelayTest(unittest.TestCase):
+    def test_retry_after_is_capped(self):
+        self.assertEqual(llm._retry_delay(_status_error(429, **{"retry-after": "3600"}), 1), llm._MAX_BACKOFF)
+        self.assertEqual(llm._retry_delay(_status_error(429, **{"retry-after": "2"}), 1), 2.0)
+
+    def test_last_attempt_gives_up_without_waiting(self):
+        last = llm_config.RETRY_ATTEMPTS
+        self.assertIsNone(llm._retry_delay(_status_error(429, **{"retry-after": "1"}), last))
+        self.assertIsNone(llm._retry_delay(_status_error(503), last))
+        self.assertIsNone(llm._retry_delay(httpx.ConnectError("down"), last))
+
+    def test_client_errors_are_not_retried(self):
+        self.assertIsNone(llm._retry_delay(_status_error(400), 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
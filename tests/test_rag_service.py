@@ -0,0 +1,81 @@
+"""
+RAG Service tests
+Run with: python -m unittest discover tests
+"""
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from app.config.indexing import IndexingConfig
+from app.services.rag import rag_service as rag
+
+
+class CoalescedQueryTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waiters_survive_starter_cancellation(self):
+        release = asyncio.Event()
+        runs = 0
+
+        async def run():
+            nonlocal runs
+            runs += 1
+            await release.wait()
+            return {"answer": "shared"}
+
+        starter = asyncio.create_task(rag._coalesced(("q",), run))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(rag._coalesced(("q",), run))
+        await asyncio.sleep(0)
+        starter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await waiter, {"answer": "shared"})
+        self.assertTrue(starter.cancelled())
+        self.assertEqual(runs, 1)
+        await asyncio.sleep(0)
+        self.assertNotIn(("q",), rag._inflight)
+
+    async def test_errors_reach_every_caller(self):
+        async def run():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            rag._coalesced(("e",), run), rag._coalesced(("e",), run), return_exceptions=True
+        )
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertNotIn(("e",), rag._inflight)
+
+
+class IndexChunksTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        embed = mock.AsyncMock(side_effect=lambda texts, batch_size: [[0.0]] * len(texts))
+        patcher = mock.patch.object(rag.embedding_service, "generate_embeddings_batched", embed)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.chunks = [{"chunk_id": f"c{i}", "text": f"chunk {i}"} for i in range(5)]
+
+    async def test_batches_are_term_indexed_off_the_loop(self):
+        threads = []
+        with mock.patch.object(rag.vector_store_service, "store_chunks"), \
+                mock.patch.object(rag.vector_store_service, "flush_writes") as flush, \
+                mock.patch.object(rag.rerank_service, "index_chunks",
+                                  side_effect=lambda batch: threads.append(threading.get_ident())):
+            stored = await rag._index_chunks("doc", self.chunks, IndexingConfig(batch_size=2))
+        self.assertEqual(stored, 5)
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.get_ident(), threads)
+        flush.assert_called_once_with()
+
+    async def test_cleanup_failure_keeps_ingest_error(self):
+        store = mock.Mock(side_effect=RuntimeError("store failed"))
+        delete = mock.Mock(side_effect=RuntimeError("delete failed"))
+        with mock.patch.object(rag.vector_store_service, "store_chunks", store), \
+                mock.patch.object(rag.vector_store_service, "delete_document", delete):
+            with self.assertRaisesRegex(RuntimeError, "store failed"):
+                await rag._index_chunks("doc", self.chunks, IndexingConfig(batch_size=2))
+        delete.assert_called_once_with("doc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Vector Store Service tests
+Run with: python -m unittest discover tests
+"""
+import json
+import tempfile
+import unittest
+
+import numpy as np
+
+from app.config import database as db_config
+from app.utils.error_handler import ExternalServiceError
+from app.vectorstore import vector_store_service as vs
+
+DIM = 8
+
+
+def _chunks(doc_id: str, n: int):
+    meta = [
+        {
+            "chunk_id": f"{doc_id}_chunk_{i}",
+            "document_id": doc_id,
+            "filename": f"{doc_id}.txt",
+            "chunk_index": i,
+            "total_chunks": n,
+            "word_count": 3,
+            "text": f"chunk {i} of {doc_id}",
+        }
+        for i in range(n)
+    ]
+    emb = np.random.default_rng(len(doc_id) + n).standard_normal((n, DIM), dtype=np.float32)
+    return meta, emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def _sidecar() -> dict:
+    with open(vs._index_path(), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _doc(doc_id: str):
+    return next((d for d in vs.list_documents() if d["document_id"] == doc_id), None)
+
+
+class VectorStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        cls._saved = db_config.CHROMA_PERSIST_DIR, db_config.EMBEDDING_DIM
+        db_config.CHROMA_PERSIST_DIR, db_config.EMBEDDING_DIM = cls._tmp.name, DIM
+        vs.initialize()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_config.CHROMA_PERSIST_DIR, db_config.EMBEDDING_DIM = cls._saved
+        vs._collection = vs._client = None
+        vs._get_collection.cache_clear()
+        cls._tmp.cleanup()
+
+    def test_multi_batch_store_is_fully_indexed(self):
+        n = 2 * db_config.BATCH_SIZE + 7
+        meta, emb = _chunks("multi", n)
+        vs.store_chunks(meta, emb)
+        self.assertEqual(_doc("multi")["chunk_count"], n)
+        self.assertEqual(len(vs.search_by_document(emb[0], "multi", top_k=n)), n)
+        vs.delete_document("multi")
+        self.assertIsNone(_doc("multi"))
+
+    def test_failed_batch_keeps_earlier_batches_indexed(self):
+        meta, emb = _chunks("partial", db_config.BATCH_SIZE + 2)
+        meta[-1]["chunk_id"] = meta[-2]["chunk_id"]  # duplicate id in batch 2
+        with self.assertRaises(ExternalServiceError):
+            vs.store_chunks(meta, emb)
+        self.assertEqual(_doc("partial")["chunk_count"], db_config.BATCH_SIZE)
+        vs.delete_document("partial")
+
+    def test_unflushed_stores_persist_once_on_flush(self):
+        meta, emb = _chunks("deferred", 30)
+        self.assertEqual(vs.search_by_document(emb[0], "deferred"), [])
+        for i in range(0, 30, 10):
+            vs.store_chunks(meta[i : i + 10], emb[i : i + 10], "2026-01-01T00:00:00+00:00", flush=False)
+        self.assertEqual(_doc("deferred")["chunk_count"], 30)
+        self.assertNotIn("deferred", _sidecar())
+        vs.flush_writes()
+        self.assertEqual(_sidecar()["deferred"]["chunk_count"], 30)
+        self.assertEqual(len(vs.search_by_document(emb[0], "deferred")), 5)
+        vs.delete_document("deferred")
+
+    def test_embedding_shape_mismatch_is_rejected(self):
+        meta, emb = _chunks("shape", 3)
+        with self.assertRaises(ValueError):
+            vs.store_chunks(meta, emb[:2])
+        self.assertIsNone(_doc("shape"))
+
+    def test_search_returns_one_list_per_query(self):
+        self.assertEqual(vs.search_similar_batch([]), [])
+        self.assertEqual(vs.search_similar_batch([[], []]), [[], []])
+        self.assertEqual(vs.search_similar([]), [])
+        self.assertEqual(vs.search_by_document(np.empty(0), "none"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()